@@ -0,0 +1,251 @@
+"""Compact, pickle-free model artifact.
+
+The fitted pipeline is StandardScaler -> HuberRegressor, so its whole state
+is four float64 arrays: the Huber coefficients and intercept and the scaler's
+mean_ and scale_. They are stored back to back in a raw little-endian buffer
+(amr_model.f64) that can be memory-mapped, next to a JSON header
+(amr_model.json) holding the gene order, the buffer layout and SHA-256
+checksums. Loading needs only NumPy and takes microseconds; joblib and
+scikit-learn are only imported to export from the original pickles.
+
+    python amr_artifact.py export   # write amr_model.json/.f64 from the pkls
+    python amr_artifact.py verify   # check the artifact against the pkls
+
+An optional bootstrap ensemble for prediction intervals is stored the same
+way (amr_ensemble.json/.f64): every bootstrap refit of the pipeline is fused
+into raw-abundance weights, and the fused models are stacked into one
+(genes x models) matrix plus a bias vector, so the whole ensemble scores a
+cohort with a single matrix product.
+
+    python amr_artifact.py ensemble training.csv --target AMR_Burden --models 200
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_HEADER_PATH = os.path.join(BASE_DIR, "amr_model.json")
+ARTIFACT_DATA_PATH = os.path.join(BASE_DIR, "amr_model.f64")
+MODEL_PKL_PATH = os.path.join(BASE_DIR, "huber_amr_model.pkl")
+SCALER_PKL_PATH = os.path.join(BASE_DIR, "scaler_top50.pkl")
+ENSEMBLE_HEADER_PATH = os.path.join(BASE_DIR, "amr_ensemble.json")
+ENSEMBLE_DATA_PATH = os.path.join(BASE_DIR, "amr_ensemble.f64")
+
+FORMAT = "amr-linear-v1"
+FIELDS = ("coef", "intercept", "mean", "scale")
+ENSEMBLE_FORMAT = "amr-ensemble-v1"
+ENSEMBLE_FIELDS = ("weights", "bias")
+
+
+def _sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def linear_state(model, scaler):
+    """Extract (coef, intercept, mean, scale) from the fitted sklearn objects."""
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+    return {
+        "coef": np.asarray(model.coef_, dtype="<f8"),
+        "intercept": np.asarray([model.intercept_], dtype="<f8"),
+        "mean": np.asarray(mean, dtype="<f8"),
+        "scale": np.asarray(scale, dtype="<f8"),
+    }
+
+
+def load_artifact(header_path=ARTIFACT_HEADER_PATH, data_path=ARTIFACT_DATA_PATH, mmap=True, fmt=FORMAT):
+    """Load the compact artifact.
+
+    Returns (header, state) where state maps coef/intercept/mean/scale to
+    float64 arrays (read-only views into a memory map when mmap is set).
+    Raises ValueError if the format or checksum does not match.
+    """
+    with open(header_path, encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != fmt:
+        raise ValueError(f"Unsupported model artifact format: {header.get('format')!r}")
+
+    if mmap:
+        buffer = np.memmap(data_path, dtype=header["dtype"], mode="r")
+    else:
+        buffer = np.fromfile(data_path, dtype=header["dtype"])
+    if hashlib.sha256(buffer.tobytes()).hexdigest() != header["sha256"]:
+        raise ValueError(f"Checksum mismatch for {data_path}")
+
+    state = {name: buffer[start:stop] for name, (start, stop) in header["layout"].items()}
+    return header, state
+
+
+def export_artifact(genes, model_path=MODEL_PKL_PATH, scaler_path=SCALER_PKL_PATH,
+                    header_path=ARTIFACT_HEADER_PATH, data_path=ARTIFACT_DATA_PATH):
+    """Write the compact artifact from the sklearn pickles and return its header."""
+    import joblib
+
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    state = linear_state(model, scaler)
+    return _write_artifact(state, FIELDS, header_path, data_path, {
+        "format": FORMAT,
+        "dtype": "<f8",
+        "n_features": len(genes),
+        "genes": list(genes),
+        "source": {
+            os.path.basename(model_path): _sha256(model_path),
+            os.path.basename(scaler_path): _sha256(scaler_path),
+        },
+    })
+
+
+def _write_artifact(state, fields, header_path, data_path, header):
+    """Write the flattened arrays back to back and a header with their layout and checksum."""
+    layout, offset = {}, 0
+    for name in fields:
+        layout[name] = [offset, offset + state[name].size]
+        offset += state[name].size
+    buffer = np.concatenate([np.asarray(state[name], dtype="<f8").ravel() for name in fields])
+    buffer.tofile(data_path)
+
+    header = {**header, "layout": layout, "sha256": hashlib.sha256(buffer.tobytes()).hexdigest()}
+    header["source"] = header.pop("source")
+    with open(header_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+        f.write("\n")
+    return header
+
+
+def fit_ensemble(X, y, n_models=200, seed=0, model_path=MODEL_PKL_PATH):
+    """Refit StandardScaler -> HuberRegressor on n_models bootstrap resamples of (X, y).
+
+    The Huber hyperparameters are taken from the shipped model. Each refit is
+    fused into raw-abundance weights (see amr_core.fuse); returns the stacked
+    (genes x models) weights and the (models,) biases.
+    """
+    import joblib
+    from sklearn.linear_model import HuberRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    from amr_core import fuse
+
+    params = joblib.load(model_path).get_params()
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    rng = np.random.default_rng(seed)
+    weights = np.empty((X.shape[1], n_models))
+    bias = np.empty(n_models)
+    for m in range(n_models):
+        rows = rng.integers(0, len(y), len(y))
+        scaler = StandardScaler().fit(X[rows])
+        model = HuberRegressor(**params).fit(scaler.transform(X[rows]), y[rows])
+        weights[:, m], bias[m] = fuse(model.coef_, model.intercept_, scaler.mean_, scaler.scale_)
+    return weights, bias
+
+
+def export_ensemble(genes, weights, bias, training_path, seed,
+                    header_path=ENSEMBLE_HEADER_PATH, data_path=ENSEMBLE_DATA_PATH):
+    """Write a fitted ensemble (see fit_ensemble) as a compact artifact and return its header."""
+    return _write_artifact({"weights": weights, "bias": bias}, ENSEMBLE_FIELDS, header_path, data_path, {
+        "format": ENSEMBLE_FORMAT,
+        "dtype": "<f8",
+        "n_features": len(genes),
+        "n_models": int(weights.shape[1]),
+        "genes": list(genes),
+        "seed": seed,
+        "source": {os.path.basename(training_path): _sha256(training_path)},
+    })
+
+
+def load_ensemble_artifact(header_path=ENSEMBLE_HEADER_PATH, data_path=ENSEMBLE_DATA_PATH):
+    """Load the ensemble artifact as (header, weights (genes x models), bias (models,))."""
+    header, state = load_artifact(header_path, data_path, fmt=ENSEMBLE_FORMAT)
+    weights = state["weights"].reshape(header["n_features"], header["n_models"])
+    return header, weights, state["bias"]
+
+
+def verify_artifact(genes, model_path=MODEL_PKL_PATH, scaler_path=SCALER_PKL_PATH,
+                    header_path=ARTIFACT_HEADER_PATH, data_path=ARTIFACT_DATA_PATH, n_samples=10_000):
+    """Check the artifact against the pickles it was exported from.
+
+    The stored arrays must equal the sklearn state bit for bit, so the fused
+    kernel built from either source gives exactly the same scores; those
+    scores are also compared with scaler.transform + model.predict on random
+    abundances. Returns the max absolute deviation from the sklearn pipeline
+    and raises ValueError on any mismatch.
+    """
+    import joblib
+
+    from amr_core import fuse, score_array
+
+    header, state = load_artifact(header_path, data_path)
+    if header["genes"] != list(genes):
+        raise ValueError("Gene order in the artifact header does not match the gene annotation")
+
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
+    reference_state = linear_state(model, scaler)
+    for name in FIELDS:
+        if not np.array_equal(state[name], reference_state[name]):
+            raise ValueError(f"Artifact field {name!r} differs from {os.path.basename(model_path)}/"
+                             f"{os.path.basename(scaler_path)}")
+
+    rng = np.random.default_rng(0)
+    X = rng.exponential(scaler.mean_, size=(n_samples, len(genes)))
+    fused_artifact = score_array(X, *fuse(state["coef"], state["intercept"][0], state["mean"], state["scale"]))
+    fused_pickle = score_array(X, *fuse(reference_state["coef"], reference_state["intercept"][0],
+                                        reference_state["mean"], reference_state["scale"]))
+    if not np.array_equal(fused_artifact, fused_pickle):
+        raise ValueError("Scores from the artifact differ from scores from the pickles")
+
+    reference = model.predict(scaler.transform(X))
+    deviation = float(np.abs(fused_artifact - reference).max())
+    if not np.allclose(fused_artifact, reference, rtol=1e-9, atol=1e-6):
+        raise ValueError(f"Artifact scores deviate from the sklearn pipeline by up to {deviation:.3g}")
+    return deviation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or verify the compact model artifact.")
+    parser.add_argument("command", choices=["export", "verify", "ensemble"])
+    parser.add_argument("training", nargs="?",
+                        help="ensemble: training CSV with a Sample_ID column, the model genes and the target")
+    parser.add_argument("--target", help="ensemble: name of the target column in the training CSV")
+    parser.add_argument("--models", type=int, default=200, help="ensemble: number of bootstrap refits")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+
+    from amr_core import GENE_INFO_PATH
+
+    genes = pd.read_csv(GENE_INFO_PATH)["AMR_Gene"].tolist()
+    if args.command == "ensemble":
+        if not args.training or not args.target:
+            parser.error("ensemble needs a training CSV and --target")
+        training = pd.read_csv(args.training, index_col=0)
+        missing = [gene for gene in genes + [args.target] if gene not in training.columns]
+        if missing:
+            print(f"Error: training data lacks {len(missing)} columns, e.g. {missing[:5]}", file=sys.stderr)
+            return 1
+        weights, bias = fit_ensemble(training[genes], training[args.target], args.models, args.seed)
+        export_ensemble(genes, weights, bias, args.training, args.seed)
+        print(f"Wrote {ENSEMBLE_HEADER_PATH} and {ENSEMBLE_DATA_PATH} ({args.models} models)", file=sys.stderr)
+        return 0
+    try:
+        if args.command == "export":
+            export_artifact(genes)
+            print(f"Wrote {ARTIFACT_HEADER_PATH} and {ARTIFACT_DATA_PATH}", file=sys.stderr)
+        deviation = verify_artifact(genes)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Artifact OK: identical to the pickles; max |score - sklearn| = {deviation:.3g}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
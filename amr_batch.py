@@ -0,0 +1,322 @@
+"""Headless batch scoring for AMR gene abundance tables.
+
+Reads the input CSV in fixed-size chunks and appends scores, risk categories
+and mechanism profiles to the output CSV as each chunk is finished, so memory
+use depends on the chunk size rather than on the number of samples.
+
+Long-format (sample, gene, abundance) CSVs are pivoted on the fly and sparse
+.npz/.mtx inputs (see amr_io.read_sparse) are scored without being
+densified. Parquet/Arrow IPC inputs are read with column projection, and
+results are written as Parquet or Arrow IPC instead of CSV when the output
+path ends in .parquet or .arrow/.feather. With --workers N a CSV input is split into byte-range shards that
+are scored in a pool of N processes (model loaded once per worker) and merged
+in order. Compressed CSVs (.gz/.bz2/.zst) are decompressed as a stream
+while parsing; they cannot be split by byte range, so they are always scored
+serially.
+
+Example:
+    python amr_batch.py cohort.csv amr_results.csv --chunksize 50000
+    python amr_batch.py cohort.csv amr_results.csv --workers 32
+    python amr_batch.py cohort.csv.zst amr_results.csv
+    python amr_batch.py cohort.npz amr_results.csv
+    python amr_batch.py cohort.parquet amr_results.parquet
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import amr_core
+import amr_io
+
+DEFAULT_CHUNKSIZE = 50_000
+SHARDS_PER_WORKER = 4
+
+
+def _scorer(explain):
+    """Per-chunk scoring function: results, or per-gene contributions with --explain."""
+    return amr_core.explain_dataframe if explain else amr_core.score_dataframe
+
+
+def _write_scored_chunks(reader, assets, out, header, explain=False):
+    """Score each chunk from reader and append it to out; returns (n, counts)."""
+    score = _scorer(explain)
+    return _write_results((score(chunk, assets) for chunk in reader), out, header)
+
+
+def _write_results(results_chunks, out, header):
+    """Append each results frame to out (a text file or amr_io.ColumnarWriter); returns (n, counts)."""
+    n_samples = 0
+    category_counts = {"Low": 0, "Moderate": 0, "High": 0}
+    for results in results_chunks:
+        if isinstance(out, amr_io.ColumnarWriter):
+            out.write(results)
+        else:
+            results.to_csv(out, header=header)
+        header = False
+
+        n_samples += len(results)
+        for category, count in results["Risk_Category"].value_counts().items():
+            category_counts[category] += int(count)
+    return n_samples, category_counts
+
+
+def _empty_results(assets, explain=False):
+    """Results frame with no rows, for headers and schemas."""
+    return _scorer(explain)(pd.DataFrame(columns=assets.top_genes, dtype=float), assets)
+
+
+def _open_output(output_path, assets, explain=False):
+    """CSV text file, or a Parquet/Arrow writer if output_path has that extension."""
+    if amr_io.columnar_format(output_path):
+        return amr_io.ColumnarWriter(output_path, _empty_results(assets, explain))
+    return open(output_path, "w", newline="", encoding="utf-8")
+
+
+def _plan(input_path, assets):
+    columns = amr_io.read_header(input_path)
+    usecols, missing = amr_io.plan_columns(columns, assets.top_genes)
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+    return columns, usecols
+
+
+def score_csv(input_path, output_path, assets, chunksize=DEFAULT_CHUNKSIZE, explain=False, compact=False):
+    """Stream input_path through the model into output_path.
+
+    Returns the number of samples scored and a count per risk category.
+    Raises ValueError if the input is missing any of the model genes. With
+    explain=True every score_* function writes each gene's exact
+    contribution to the score (amr_core.explain_dataframe) instead of the
+    mechanism profile. With compact=True abundances are parsed and scored
+    as float32 (amr_core.compact_scores).
+    """
+    _, usecols = _plan(input_path, assets)
+    reader = amr_io.read_abundances(input_path, assets.top_genes, usecols, chunksize,
+                                    dtype=amr_core.COMPACT_DTYPE if compact else None)
+    with _open_output(output_path, assets, explain) as out:
+        return _write_scored_chunks(reader, assets, out, header=True, explain=explain)
+
+
+def score_sparse(input_path, output_path, assets, chunksize=DEFAULT_CHUNKSIZE, explain=False):
+    """Score a sparse .npz/.mtx matrix (see amr_io.read_sparse) into output_path.
+
+    The matrix stays sparse throughout: scores and mechanism totals are
+    sparse-dense products over the input's own columns, so only nonzero
+    abundances are touched. Contributions (explain=True) and the
+    out-of-distribution check are dense, so only the model genes of each
+    chunk are densified for them.
+    """
+    X, genes, sample_ids = amr_io.read_sparse(input_path)
+    weights, mech_matrix = amr_core.embed_in_columns(genes, assets)
+    model_columns = pd.Index(genes).get_indexer(assets.top_genes)
+
+    def results_chunks():
+        for start in range(0, X.shape[0], chunksize):
+            rows = X[start:start + chunksize]
+            ids = sample_ids[start:start + chunksize]
+            amr_core.check_finite(rows, ids)
+            scores = amr_core.score_array(rows, weights, assets.bias)
+            if explain:
+                contributions = amr_core.gene_contributions(rows[:, model_columns], assets.weights, assets.mean)
+                yield amr_core.contributions_frame(ids, scores, contributions, assets)
+            else:
+                profiles = amr_core.mechanism_profiles(rows, mech_matrix)
+                ood = amr_core.ood_frame(rows[:, model_columns], assets)
+                yield amr_core.results_frame(ids, scores, profiles, assets, ood)
+
+    with _open_output(output_path, assets, explain) as out:
+        return _write_results(results_chunks(), out, header=True)
+
+
+def score_long_format(input_path, output_path, assets, chunksize=DEFAULT_CHUNKSIZE, explain=False):
+    """Score a long (sample, gene, abundance) CSV into output_path.
+
+    The table is pivoted on the fly by amr_io.read_long_format, keeping only
+    model genes; model genes that never occur are reported on stderr and
+    count as zero abundance. Raises ValueError if no model gene occurs.
+    """
+    df, unobserved = amr_io.read_long_format(input_path, assets.top_genes)
+    if df is None:
+        raise ValueError(f"Missing {len(unobserved)} required genes, e.g. {unobserved[:5]}")
+    if unobserved:
+        print(f"Note: {len(unobserved)} model genes never occur in {input_path}; "
+              f"treated as zero abundance", file=sys.stderr)
+    with _open_output(output_path, assets, explain) as out:
+        return _write_scored_chunks(_row_chunks(df, chunksize), assets, out, header=True, explain=explain)
+
+
+def score_columnar(input_path, output_path, assets, chunksize=DEFAULT_CHUNKSIZE, explain=False):
+    """Score a Parquet/Arrow IPC table into output_path.
+
+    Only the sample-ID column and the model genes are read from disk, one
+    batch of chunksize rows at a time (see amr_io.iter_columnar). Raises
+    ValueError if any model gene is missing.
+    """
+    chunks, missing = amr_io.iter_columnar(input_path, assets.top_genes, chunksize)
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+    with _open_output(output_path, assets, explain) as out:
+        return _write_scored_chunks(chunks, assets, out, header=True, explain=explain)
+
+
+def _row_chunks(df, chunksize):
+    return (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+
+
+# --------------------------------------------------
+# Sharded scoring across a process pool
+# --------------------------------------------------
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, stop) of a file."""
+
+    def __init__(self, path, start, stop):
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = stop - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._file.readinto(memoryview(buffer)[:min(len(buffer), self._remaining)])
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def shard_ranges(path, n_shards):
+    """Split the body of a CSV into up to n_shards byte ranges on line boundaries.
+
+    Assumes no quoted field spans several lines, which holds for abundance
+    tables.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        bounds = [len(f.readline())]
+        for k in range(1, n_shards):
+            f.seek(max(bounds[0], size * k // n_shards))
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+_worker_assets = None
+
+def _init_worker():
+    global _worker_assets
+    _worker_assets = amr_core.load_assets()
+
+def _score_shard(input_path, start, stop, columns, usecols, part_path, chunksize, explain, compact):
+    with io.BufferedReader(_ByteRange(input_path, start, stop), buffer_size=1 << 20) as source:
+        reader = amr_io.read_abundances(source, _worker_assets.top_genes, usecols, chunksize, names=columns,
+                                        dtype=amr_core.COMPACT_DTYPE if compact else None)
+        with _open_output(part_path, _worker_assets, explain) as out:
+            return _write_scored_chunks(reader, _worker_assets, out, header=False, explain=explain)
+
+
+def score_csv_sharded(input_path, output_path, assets, workers, chunksize=DEFAULT_CHUNKSIZE, explain=False,
+                      compact=False):
+    """Like score_csv, but shards the input by byte range over a process pool.
+
+    Each worker loads the model once, then parses, scores and profiles its
+    shards into part files; the parts are concatenated in input order, so the
+    output is identical to score_csv. For Parquet/Arrow output the parts are
+    written in that format and their record batches copied over.
+    """
+    columns, usecols = _plan(input_path, assets)
+    ranges = shard_ranges(input_path, workers * SHARDS_PER_WORKER)
+
+    n_samples = 0
+    category_counts = {"Low": 0, "Moderate": 0, "High": 0}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as tmp:
+        suffix = os.path.splitext(output_path)[1] if amr_io.columnar_format(output_path) else ".csv"
+        part_paths = [os.path.join(tmp, f"part-{i:05d}{suffix}") for i in range(len(ranges))]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(_score_shard, input_path, start, stop, columns, usecols, part_path, chunksize, explain,
+                            compact)
+                for (start, stop), part_path in zip(ranges, part_paths)
+            ]
+            for future in futures:
+                n, counts = future.result()
+                n_samples += n
+                for category, count in counts.items():
+                    category_counts[category] += count
+
+        with _open_output(output_path, assets, explain) as out:
+            if isinstance(out, amr_io.ColumnarWriter):
+                for part_path in part_paths:
+                    out.copy_from(part_path)
+            else:
+                # Header row from an empty results frame, so columns always match the parts
+                _empty_results(assets, explain).to_csv(out)
+                for part_path in part_paths:
+                    with open(part_path, encoding="utf-8") as part:
+                        shutil.copyfileobj(part, out)
+
+    return n_samples, category_counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score AMR gene abundance CSVs without the Streamlit UI.")
+    parser.add_argument("input", help="CSV with samples as rows and AMR genes as columns (first column = Sample_ID), "
+                                      "optionally .gz/.bz2/.zst compressed, a Parquet/Arrow IPC table, "
+                                      "a long-format (sample, gene, abundance) CSV, or a sparse .npz/.mtx matrix")
+    parser.add_argument("output", help="File to write results to: CSV, or Parquet/Arrow IPC by extension "
+                                       "(.parquet, .arrow/.feather)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help=f"Samples parsed and scored per chunk (default: {DEFAULT_CHUNKSIZE})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; above 1 the input is split into byte-range shards (default: 1)")
+    parser.add_argument("--explain", action="store_true",
+                        help="Write each model gene's exact contribution to the score instead of the "
+                             "mechanism profile")
+    parser.add_argument("--compact", action="store_true",
+                        help="Parse and score wide CSV input as float32; scores stay within a documented error "
+                             "bound of float64, and only samples within float32 input rounding of a risk "
+                             "threshold can change category")
+    args = parser.parse_args(argv)
+
+    assets = amr_core.load_assets()
+    try:
+        if args.compact and (amr_io.is_sparse_input(args.input) or amr_io.columnar_format(args.input)
+                             or amr_io.is_long_format(amr_io.read_header(args.input), assets.top_genes)):
+            print("Note: --compact applies to wide CSV input only; scoring in float64", file=sys.stderr)
+        if amr_io.is_sparse_input(args.input):
+            n_samples, category_counts = score_sparse(args.input, args.output, assets, args.chunksize, explain=args.explain)
+        elif amr_io.columnar_format(args.input):
+            n_samples, category_counts = score_columnar(args.input, args.output, assets, args.chunksize, explain=args.explain)
+        elif amr_io.is_long_format(amr_io.read_header(args.input), assets.top_genes):
+            n_samples, category_counts = score_long_format(args.input, args.output, assets, args.chunksize, explain=args.explain)
+        elif args.workers > 1 and amr_io.is_compressed(args.input):
+            print("Note: compressed input cannot be sharded by byte range; scoring serially", file=sys.stderr)
+            n_samples, category_counts = score_csv(args.input, args.output, assets, args.chunksize,
+                                                   explain=args.explain, compact=args.compact)
+        elif args.workers > 1:
+            n_samples, category_counts = score_csv_sharded(args.input, args.output, assets, args.workers,
+                                                           args.chunksize, explain=args.explain,
+                                                           compact=args.compact)
+        else:
+            n_samples, category_counts = score_csv(args.input, args.output, assets, args.chunksize,
+                                                   explain=args.explain, compact=args.compact)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Scored {n_samples} samples -> {args.output}", file=sys.stderr)
+    print("  " + ", ".join(f"{k}: {v}" for k, v in category_counts.items()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""Chart specs for the AMR burden predictor.
+
+Charts are built as Altair (Vega-Lite) specs and drawn in the browser, so the
+server only serializes a small JSON document per chart instead of
+rasterizing a PNG.
+"""
+import altair as alt
+import pandas as pd
+
+
+def mechanism_chart(mech_profile):
+    """Horizontal bar chart of a mechanism profile, largest share on top."""
+    chart_df = pd.DataFrame({
+        "Mechanism": list(mech_profile.keys()),
+        "Proportion": list(mech_profile.values())
+    })
+    base = alt.Chart(chart_df).encode(
+        x=alt.X("Proportion:Q", scale=alt.Scale(domain=[0, 1]), axis=alt.Axis(format="%")),
+        y=alt.Y("Mechanism:N", sort="-x", title=None),
+    )
+    bars = base.mark_bar().encode(
+        color=alt.Color("Mechanism:N", scale=alt.Scale(scheme="set3"), legend=None),
+        tooltip=["Mechanism", alt.Tooltip("Proportion:Q", format=".1%")],
+    )
+    # Only label if significant
+    labels = base.transform_filter(alt.datum.Proportion > 0.05).mark_text(align="left", dx=3).encode(
+        text=alt.Text("Proportion:Q", format=".1%")
+    )
+    return (bars + labels).properties(title="Resistance Mechanism Distribution", height=260)
@@ -0,0 +1,617 @@
+"""Scoring library for the AMR burden predictor.
+
+Side-effect free: importing this module loads nothing from disk and pulls in
+neither streamlit, matplotlib nor scikit-learn, so pipelines, notebooks and
+workers can use it directly. The model itself is read from the compact
+artifact written by amr_artifact.py. The Streamlit app (app.py) and the
+batch scorer (amr_batch.py) are thin layers over it.
+
+    import amr_core
+    assets = amr_core.load_assets()
+    results = amr_core.score_dataframe(df, assets)
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from amr_artifact import (ARTIFACT_DATA_PATH, ARTIFACT_HEADER_PATH, ENSEMBLE_DATA_PATH, ENSEMBLE_HEADER_PATH,
+                          load_artifact, load_ensemble_artifact)
+
+# --------------------------------------------------
+# Paths
+# --------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GENE_INFO_PATH = os.path.join(BASE_DIR, "top50_shap_genes_annotated.csv")
+
+
+class Assets(NamedTuple):
+    gene_info: pd.DataFrame
+    mech_matrix: np.ndarray
+    mechanisms: list
+    # StandardScaler -> HuberRegressor state, and the fused kernel derived from it
+    coef: np.ndarray
+    intercept: float
+    mean: np.ndarray
+    scale: np.ndarray
+    weights: np.ndarray
+    bias: float
+    version: str
+
+    @property
+    def top_genes(self):
+        return self.gene_info["AMR_Gene"].tolist()
+
+
+# --------------------------------------------------
+# Load model & metadata
+# --------------------------------------------------
+def artifact_version(paths=(ARTIFACT_HEADER_PATH, ARTIFACT_DATA_PATH, GENE_INFO_PATH)):
+    """Short content hash of the model artifacts, used to key cached results."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def load_assets():
+    header, state = load_artifact()
+    gene_info = pd.read_csv(GENE_INFO_PATH)
+    if header["genes"] != gene_info["AMR_Gene"].tolist():
+        raise ValueError("Gene order in the model artifact does not match the gene annotation")
+
+    # Exact pattern replacement for the specific format in your image
+    # First, let's standardize all variations to "Non-Specific Resistance"
+
+    # Create a mapping of patterns to replace
+    replace_dict = {
+        "Other / Unclassified": "Non-Specific Resistance",
+        "Other/Unclassified": "Non-Specific Resistance",
+        "Other /Unclassified": "Non-Specific Resistance",
+        "Other/ Unclassified": "Non-Specific Resistance",
+        "general/Unknown": "Non-Specific Resistance",
+        "general / Unknown": "Non-Specific Resistance",
+        "Other": "Non-Specific Resistance",
+        "Unclassified": "Non-Specific Resistance",
+        "Unknown": "Non-Specific Resistance",
+        "Non-specific": "Non-Specific Resistance",
+        "non-specific": "Non-Specific Resistance"
+    }
+
+    # Apply the replacement
+    gene_info["Resistance_Mechanism"] = gene_info["Resistance_Mechanism"].replace(replace_dict)
+
+    # Also do a case-insensitive check for any remaining variations
+    def final_cleanup(mechanism):
+        mech = str(mechanism).strip()
+        # Check if it contains any of our target words (case insensitive)
+        if any(word in mech.lower() for word in ["other", "unclassified", "unknown", "non-specific", "general"]):
+            return "Non-Specific Resistance"
+        return mech
+
+    gene_info["Resistance_Mechanism"] = gene_info["Resistance_Mechanism"].apply(final_cleanup)
+
+    # Gene -> mechanism incidence matrix (genes x mechanisms), built once so
+    # every sample's profile comes out of a single matrix multiply
+    mechanisms = pd.unique(gene_info["Resistance_Mechanism"]).tolist()
+    mech_codes = pd.Categorical(gene_info["Resistance_Mechanism"], categories=mechanisms).codes
+    mech_matrix = np.zeros((len(gene_info), len(mechanisms)))
+    mech_matrix[np.arange(len(gene_info)), mech_codes] = 1.0
+
+    coef = np.asarray(state["coef"])
+    intercept = float(state["intercept"][0])
+    mean = np.asarray(state["mean"])
+    scale = np.asarray(state["scale"])
+    weights, bias = fuse(coef, intercept, mean, scale)
+
+    return Assets(gene_info, mech_matrix, mechanisms, coef, intercept, mean, scale,
+                  weights, bias, artifact_version())
+
+
+class Ensemble(NamedTuple):
+    # Bootstrap refits fused into raw-abundance weights and stacked column-wise
+    weights: np.ndarray  # genes x models
+    bias: np.ndarray     # models
+    version: str
+
+    @property
+    def n_models(self):
+        return self.weights.shape[1]
+
+
+def load_ensemble(assets):
+    """Load the optional bootstrap ensemble (see amr_artifact.py ensemble).
+
+    Returns None if no ensemble has been exported; raises ValueError if its
+    gene order does not match the model's.
+    """
+    if not os.path.exists(ENSEMBLE_HEADER_PATH):
+        return None
+    header, weights, bias = load_ensemble_artifact()
+    if header["genes"] != assets.top_genes:
+        raise ValueError("Gene order in the ensemble artifact does not match the gene annotation")
+    return Ensemble(weights, bias, artifact_version((ENSEMBLE_HEADER_PATH, ENSEMBLE_DATA_PATH)))
+
+
+def fuse(coef, intercept, mean, scale):
+    """Fold StandardScaler into the Huber coefficients.
+
+    model.predict(scaler.transform(X)) == X @ weights + bias, so raw abundances
+    can be scored with one dot product and no scaled copy of X. amr_artifact.py
+    checks this against the sklearn pipeline when the artifact is exported.
+    """
+    weights = coef / scale
+    bias = float(intercept - weights @ mean)
+    return weights, bias
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by the total size of its entries.
+
+    Callers pass each entry's size in bytes; the least recently used entries
+    are evicted once the total would exceed max_bytes. An entry bigger than
+    the whole budget is not stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            while self._entries and self.total_bytes + nbytes > self.max_bytes:
+                self.total_bytes -= self._entries.popitem(last=False)[1][1]
+            self._entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# --------------------------------------------------
+# Helper functions
+# --------------------------------------------------
+RISK_CATEGORIES = ("Low", "Moderate", "High")
+DEFAULT_RISK_THRESHOLDS = (3e6, 5e6)
+
+def parse_thresholds(text):
+    """Low/Moderate and Moderate/High cut points from text such as "3e6,5e6"."""
+    try:
+        thresholds = tuple(float(value) for value in text.split(","))
+    except ValueError:
+        raise ValueError(f"Risk thresholds must be numbers, got {text!r}") from None
+    if len(thresholds) != len(RISK_CATEGORIES) - 1 or not thresholds[0] < thresholds[1]:
+        raise ValueError(f"Expected two increasing risk thresholds, got {text!r}")
+    return thresholds
+
+# Per-deployment cut points, e.g. AMR_RISK_THRESHOLDS="2.5e6,6e6"; read once at
+# import, so worker processes and the server inherit the same configuration
+RISK_THRESHOLDS = (parse_thresholds(os.environ["AMR_RISK_THRESHOLDS"])
+                   if os.environ.get("AMR_RISK_THRESHOLDS") else DEFAULT_RISK_THRESHOLDS)
+
+def risk_codes(scores, thresholds=None):
+    """Index into RISK_CATEGORIES for every score, binned in one np.digitize call.
+
+    Raises ValueError for NaN scores, which np.digitize would bin as High.
+    """
+    if np.isnan(scores).any():
+        raise ValueError("NaN scores have no risk category; check the input with check_finite")
+    return np.digitize(scores, RISK_THRESHOLDS if thresholds is None else thresholds).astype(np.int8)
+
+def risk_categories(scores, thresholds=None):
+    """Vectorized risk_category over a whole score array."""
+    return np.asarray(RISK_CATEGORIES, dtype=object)[risk_codes(scores, thresholds)]
+
+def risk_category(score, thresholds=None):
+    if np.isnan(score):
+        raise ValueError("A NaN score has no risk category")
+    return RISK_CATEGORIES[int(np.digitize(score, RISK_THRESHOLDS if thresholds is None else thresholds))]
+
+def cohort_summary(scores, codes=None, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), ood_flags=None):
+    """JSON-ready cohort statistics from one pass over the score array.
+
+    codes are the risk_codes of scores, if already computed; with the
+    samples' ood_flags (see ood_frame) the out-of-distribution count is added.
+    """
+    codes = risk_codes(scores) if codes is None else codes
+    counts = np.bincount(codes, minlength=len(RISK_CATEGORIES))
+    values = np.quantile(scores, quantiles) if len(scores) else np.full(len(quantiles), np.nan)
+    summary = {
+        "n_samples": int(len(scores)),
+        "risk_thresholds": list(RISK_THRESHOLDS),
+        "category_counts": dict(zip(RISK_CATEGORIES, counts.tolist())),
+        "mean_score": round(float(np.mean(scores)), 3) if len(scores) else None,
+        "score_quantiles": {f"P{round(q * 100):02d}": round(float(v), 3) for q, v in zip(quantiles, values)},
+    }
+    if ood_flags is not None:
+        summary["ood_thresholds"] = dict(zip(("rms_z", "max_abs_z"), OOD_THRESHOLDS))
+        summary["out_of_distribution"] = int(np.count_nonzero(ood_flags))
+    return summary
+
+# A sample is out of distribution when the RMS of its z-scores against the
+# scaler's training mean and scale, or the |z| of any one gene, exceeds these
+DEFAULT_OOD_THRESHOLDS = (3.0, 10.0)
+
+def parse_ood_thresholds(text):
+    """RMS z and max |z| limits from text such as "3,10"."""
+    try:
+        thresholds = tuple(float(value) for value in text.split(","))
+    except ValueError:
+        raise ValueError(f"OOD thresholds must be numbers, got {text!r}") from None
+    if len(thresholds) != 2 or not all(value > 0 for value in thresholds):
+        raise ValueError(f"Expected two positive OOD thresholds (RMS z, max |z|), got {text!r}")
+    return thresholds
+
+OOD_THRESHOLDS = (parse_ood_thresholds(os.environ["AMR_OOD_THRESHOLDS"])
+                  if os.environ.get("AMR_OOD_THRESHOLDS") else DEFAULT_OOD_THRESHOLDS)
+
+# Opt-in compact mode: abundances parsed and scored as float32 (see compact_scores)
+COMPACT_DTYPE = np.float32
+
+def _as_matrix(X):
+    # scipy.sparse matrices pass through untouched so products only visit nonzeros
+    if "scipy.sparse" in sys.modules and sys.modules["scipy.sparse"].issparse(X):
+        return X
+    X = np.asarray(X)
+    # Compact input stays float32 instead of being upcast to a float64 copy
+    return X if X.dtype == COMPACT_DTYPE else X.astype(float, copy=False)
+
+def _like(X, array):
+    """array in X's dtype if X is compact, so products don't upcast X."""
+    return array.astype(COMPACT_DTYPE) if X.dtype == COMPACT_DTYPE else array
+
+def check_finite(X, sample_ids=None):
+    """Raise ValueError if abundances X (dense or scipy.sparse) hold NaN or infinite values.
+
+    The fused kernel does no input checking of its own, so every scoring
+    path calls this first; amr_quality.validate gives the full report.
+    """
+    if hasattr(X, "tocsr"):
+        X = X.tocsr()
+        bad = np.flatnonzero(~np.isfinite(X.data))
+        rows = np.searchsorted(X.indptr, bad, side="right") - 1
+    else:
+        bad = np.flatnonzero(~np.isfinite(X))
+        rows = bad // X.shape[1] if X.ndim == 2 else bad
+    if len(bad):
+        first = rows[0] if sample_ids is None else sample_ids[rows[0]]
+        raise ValueError(f"Input contains {len(bad)} missing or infinite abundances, e.g. in sample {first}")
+
+def score_array(X, weights, bias):
+    """AMR burden scores for raw abundances X (columns in TOP_GENES order).
+
+    X may be a scipy.sparse matrix; the scaler's centering is already folded
+    into bias, so only the nonzero entries are touched. Float32 X is scored
+    in float32 through compact_scores.
+    """
+    X = _as_matrix(X)
+    if X.dtype == COMPACT_DTYPE:
+        return compact_scores(X, weights, bias)[0]
+    return np.asarray(X @ weights).ravel() + bias
+
+def compact_scores(X, weights, bias, thresholds=None):
+    """Scores of float32 abundances X, with a per-sample bound on their error.
+
+    Returns float64 (scores, bound), where |scores - float64 scores| <= bound.
+    For the n genes of a sample, the error of the float32 sum is at most
+    (n + 4) * u * sum_j |w_j| |x_j|, where u = 2**-24 is float32's unit
+    roundoff. This covers rounding the inputs and weights to float32 as well
+    as the accumulation. The weighted total is taken over |x| a chunk at a
+    time, so the bound also holds for negative abundances. Samples whose
+    bound reaches one of the risk thresholds are rescored in float64, so
+    compact mode never changes a risk category. Those samples are then only
+    off by the rounding of their inputs.
+    """
+    X = _as_matrix(X)
+    u = np.finfo(X.dtype).eps / 2
+    scores = np.asarray(X @ weights.astype(X.dtype)).astype(float) + bias
+    weighted_total = _abs_products(X, np.abs(weights).astype(X.dtype)).astype(float)
+    bound = (X.shape[1] + 4) * u * weighted_total
+
+    thresholds = np.asarray(RISK_THRESHOLDS if thresholds is None else thresholds, dtype=float)
+    near = np.flatnonzero((np.abs(scores[:, None] - thresholds) <= bound[:, None]).any(axis=1))
+    if len(near):
+        scores[near] = score_array(X[near].astype(float), weights, bias)
+        bound[near] = u * weighted_total[near]
+    return scores, bound
+
+def _abs_products(X, v, chunksize=4096):
+    """|X| @ v, with |X| built one chunk of rows at a time in a reused buffer."""
+    if hasattr(X, "tocsr"):
+        return np.asarray(abs(X) @ v)
+    out = np.empty(len(X), dtype=X.dtype)
+    buffer = np.empty((min(chunksize, len(X)), X.shape[1]), dtype=X.dtype)
+    for start in range(0, len(X), chunksize):
+        chunk = X[start:start + chunksize]
+        out[start:start + len(chunk)] = np.abs(chunk, out=buffer[:len(chunk)]) @ v
+    return out
+
+def mechanism_profiles(X, mech_matrix):
+    """Mechanism proportions for every sample as a (samples x mechanisms) array.
+
+    X holds abundances with columns in TOP_GENES order (dense or scipy.sparse).
+    Columns of the result follow the asset's mechanisms; samples with a
+    non-positive total get all zeros.
+    """
+    X = _as_matrix(X)
+    # Totals of compact input are summed in float32, proportions computed in float64
+    mech_totals = np.asarray(X @ _like(X, mech_matrix)).astype(float, copy=False)
+    totals = mech_totals.sum(axis=1, keepdims=True)
+    profiles = np.divide(mech_totals, totals, out=np.zeros_like(mech_totals), where=totals > 0)
+    return np.round(profiles, 3)
+
+def score_intervals(X, ensemble, quantiles=(0.05, 0.5, 0.95), chunksize=20_000):
+    """Score quantiles and risk-category probabilities under the bootstrap ensemble.
+
+    Each chunk of samples is scored by every model at once with one
+    (samples x genes) @ (genes x models) product; X may be scipy.sparse.
+    Returns (score_quantiles, category_probs): (samples x quantiles) and
+    (samples x RISK_CATEGORIES) arrays, the latter being the fraction of
+    models placing the sample in each category.
+    """
+    n = X.shape[0]
+    score_quantiles = np.empty((n, len(quantiles)))
+    category_probs = np.empty((n, len(RISK_CATEGORIES)))
+    # Linear interpolation between order statistics, as np.quantile does; a
+    # row-wise sort over the few models is much cheaper than np.quantile
+    position = np.asarray(quantiles) * (ensemble.n_models - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.ceil(position).astype(int)
+    for start in range(0, n, chunksize):
+        rows = slice(start, start + chunksize)
+        S = np.sort(np.asarray(_as_matrix(X[rows]) @ ensemble.weights) + ensemble.bias, axis=1)
+        score_quantiles[rows] = S[:, lower] + (S[:, upper] - S[:, lower]) * (position - lower)
+        # Fraction of models below each threshold; categories are the differences
+        below = [np.zeros(S.shape[0])] + [(S < t).mean(axis=1) for t in RISK_THRESHOLDS] + [np.ones(S.shape[0])]
+        category_probs[rows] = np.diff(np.column_stack(below), axis=1)
+    return score_quantiles, category_probs
+
+def uncertainty_frame(score_quantiles, category_probs, index=None, quantiles=(0.05, 0.5, 0.95)):
+    """Columns Score_P05/Score_P50/Score_P95 (per quantile) and P_Low/P_Moderate/P_High."""
+    columns = [f"Score_P{round(q * 100):02d}" for q in quantiles] + [f"P_{c}" for c in RISK_CATEGORIES]
+    return pd.DataFrame(np.hstack([score_quantiles.round(3), category_probs.round(3)]),
+                        index=index, columns=columns)
+
+def ood_statistics(X, mean, scale, chunksize=4096):
+    """Standardized distance of every sample from the scaler's training distribution.
+
+    z_ij = (x_ij - mean_j) / scale_j are the model's own scaled features.
+    Returns (distance, max_abs_z, max_gene): the RMS of each sample's z over
+    the genes, its largest |z| and the column of that gene. Rows are
+    standardized a cache-sized chunk at a time, so the only temporary is one
+    chunk of z; X may be scipy.sparse.
+    """
+    n_samples, n_genes = X.shape
+    distance = np.empty(n_samples)
+    max_abs_z = np.empty(n_samples)
+    max_gene = np.empty(n_samples, dtype=np.intp)
+    inv_scale = 1.0 / scale
+    buffer = None
+    for start in range(0, n_samples, chunksize):
+        rows = slice(start, start + chunksize)
+        chunk = X[rows]
+        chunk = chunk.toarray() if hasattr(chunk, "toarray") else _as_matrix(chunk)
+        if buffer is None:
+            buffer = np.empty((min(chunksize, n_samples), n_genes), dtype=chunk.dtype)
+        Z = np.subtract(chunk, _like(chunk, mean), out=buffer[:len(chunk)])
+        Z *= _like(chunk, inv_scale)
+        distance[rows] = np.sqrt(np.einsum("ij,ij->i", Z, Z) / n_genes)
+        np.abs(Z, out=Z)
+        genes = Z.argmax(axis=1)
+        max_gene[rows] = genes
+        max_abs_z[rows] = Z[np.arange(len(Z)), genes]
+    return distance, max_abs_z, max_gene
+
+def ood_frame(X, assets, index=None, thresholds=None):
+    """Out-of-distribution columns for every sample of X (see ood_statistics).
+
+    OOD_Flag is set when OOD_Distance (RMS z) or Max_Abs_Z exceeds
+    thresholds, by default OOD_THRESHOLDS; Max_Z_Gene names the gene
+    furthest from its training mean.
+    """
+    distance, max_abs_z, max_gene = ood_statistics(X, assets.mean, assets.scale)
+    rms_limit, z_limit = OOD_THRESHOLDS if thresholds is None else thresholds
+    ood = pd.DataFrame({
+        "OOD_Flag": (distance > rms_limit) | (max_abs_z > z_limit),
+        "OOD_Distance": distance.round(3),
+        "Max_Abs_Z": max_abs_z.round(3),
+    }, index=index)
+    # Categorical codes are the argmax itself, so no per-sample strings are built
+    ood["Max_Z_Gene"] = pd.Categorical.from_codes(max_gene, categories=assets.top_genes)
+    return ood
+
+def gene_contributions(X, weights, mean):
+    """Exact per-gene contributions to every score, as a dense (samples x genes) array.
+
+    The model is linear in the scaled features, so gene j adds
+    coef_j * (x_ij - mean_j) / scale_j == weights_j * (x_ij - mean_j) to
+    sample i's score and each row sums to score - intercept. X holds
+    abundances with columns in TOP_GENES order (dense or scipy.sparse);
+    float32 X gives float32 contributions.
+    """
+    X = X.toarray() if hasattr(X, "toarray") else _as_matrix(X)
+    return (X - _like(X, mean)) * _like(X, weights)
+
+def top_contributions(contributions, k=5):
+    """Column indices of the k largest |contributions| per sample, strongest first.
+
+    Uses a partial sort (argpartition) over all genes and fully sorts only the
+    k selected per row.
+    """
+    contributions = np.atleast_2d(contributions)
+    k = min(k, contributions.shape[1])
+    magnitude = np.abs(contributions)
+    top = np.argpartition(-magnitude, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(magnitude, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+def profile_dict(profile_row, mechanisms):
+    return dict(zip(mechanisms, profile_row.tolist()))
+
+def sample_result(sample_id, score, profile_row, mechanisms, category=None, ood=None):
+    """JSON-ready result record for one sample.
+
+    category may be passed in when the cohort's categories were already
+    binned (see risk_categories); ood is the sample's ood_frame row as a
+    dict, appended to the record.
+    """
+    mech_profile = profile_dict(profile_row, mechanisms)
+    result = {
+        "Sample_ID": sample_id,
+        "AMR_Risk_Score": round(float(score), 3),
+        "Risk_Category": risk_category(score) if category is None else category,
+        "Resistance_Mechanism_Profile": mech_profile,
+        "Interpretation": interpret(mech_profile)
+    }
+    if ood is not None:
+        result.update(ood)
+    return result
+
+def iter_results_ndjson(sample_ids, scores, profiles, mechanisms, chunksize=10_000, categories=None, ood=None):
+    """Yield the sample_result records as NDJSON text, chunksize lines at a time.
+
+    categories are the precomputed risk_categories of scores, if any, and
+    ood the samples' ood_frame.
+    """
+    for start, ids, chunk_categories, chunk_ood in _record_chunks(sample_ids, scores, chunksize, categories, ood):
+        yield "".join(
+            json.dumps(sample_result(sample_id, scores[i], profiles[i], mechanisms, category, sample_ood)) + "\n"
+            for i, sample_id, category, sample_ood in zip(range(start, start + len(ids)), ids, chunk_categories,
+                                                           chunk_ood)
+        )
+
+def iter_results_csv(sample_ids, scores, profiles, mechanisms, chunksize=10_000, categories=None, ood=None):
+    """Yield the sample_result records as CSV text (header first), chunksize rows at a time."""
+    for start, ids, chunk_categories, chunk_ood in _record_chunks(sample_ids, scores, chunksize, categories, ood):
+        records = [
+            sample_result(sample_id, scores[i], profiles[i], mechanisms, category, sample_ood)
+            for i, sample_id, category, sample_ood in zip(range(start, start + len(ids)), ids, chunk_categories,
+                                                           chunk_ood)
+        ]
+        yield pd.DataFrame(records).to_csv(index=False, header=start == 0)
+
+def _record_chunks(sample_ids, scores, chunksize, categories, ood=None):
+    for start in range(0, len(scores), chunksize):
+        rows = slice(start, start + chunksize)
+        chunk_categories = risk_categories(scores[rows]) if categories is None else categories[rows]
+        chunk_ood = ood.iloc[rows].to_dict("records") if ood is not None else [None] * len(chunk_categories)
+        yield start, np.asarray(sample_ids[rows]).tolist(), chunk_categories, chunk_ood
+
+def score_dataframe(df, assets, ensemble=None):
+    """Score a (samples x genes) DataFrame and return one results row per sample.
+
+    Columns: AMR_Risk_Score, Risk_Category, one proportion column per
+    mechanism, Interpretation and the ood_frame columns, followed by the
+    uncertainty_frame columns if an ensemble (see load_ensemble) is given.
+    Extra gene columns are ignored; raises ValueError if any model gene is
+    missing.
+    """
+    missing = [gene for gene in assets.top_genes if gene not in df.columns]
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+
+    X = df[assets.top_genes].to_numpy()
+    check_finite(X, df.index)
+    scores = score_array(X, assets.weights, assets.bias)
+    profiles = mechanism_profiles(X, assets.mech_matrix)
+    results = results_frame(df.index, scores, profiles, assets, ood_frame(X, assets, index=df.index))
+    if ensemble is not None:
+        results = results.join(uncertainty_frame(*score_intervals(X, ensemble), index=results.index))
+    return results
+
+def explain_dataframe(df, assets):
+    """Like score_dataframe, but with one contribution column per model gene
+    (see gene_contributions) in place of the mechanism profile."""
+    missing = [gene for gene in assets.top_genes if gene not in df.columns]
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+
+    X = df[assets.top_genes].to_numpy()
+    check_finite(X, df.index)
+    scores = score_array(X, assets.weights, assets.bias)
+    return contributions_frame(df.index, scores, gene_contributions(X, assets.weights, assets.mean), assets)
+
+def embed_in_columns(columns, assets):
+    """Fused weights and mechanism matrix laid out over an input's own columns.
+
+    Columns that are not model genes get zero weight, so a wide sparse matrix
+    can be scored as-is, without selecting or densifying columns. Raises
+    ValueError if any model gene is missing.
+    """
+    positions = {gene: i for i, gene in enumerate(columns)}
+    missing = [gene for gene in assets.top_genes if gene not in positions]
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+
+    rows = [positions[gene] for gene in assets.top_genes]
+    weights = np.zeros(len(columns))
+    weights[rows] = assets.weights
+    mech_matrix = np.zeros((len(columns), len(assets.mechanisms)))
+    mech_matrix[rows] = assets.mech_matrix
+    return weights, mech_matrix
+
+def results_frame(sample_ids, scores, profiles, assets, ood=None):
+    """Results table (as returned by score_dataframe) from scores, profiles and, if given, the ood_frame."""
+    results = pd.DataFrame(profiles, index=sample_ids, columns=assets.mechanisms)
+    results.insert(0, "AMR_Risk_Score", scores.round(3))
+    results.insert(1, "Risk_Category", pd.Series(risk_categories(scores), index=results.index, dtype=str))
+    results["Interpretation"] = pd.Series(
+        [interpret(profile_dict(row, assets.mechanisms)) for row in profiles], index=results.index, dtype=str
+    )
+    if ood is not None:
+        for column in ood.columns:
+            results[column] = ood[column].to_numpy()
+    results.index.name = "Sample_ID"
+    return results
+
+def contributions_frame(sample_ids, scores, contributions, assets):
+    """Contribution table (as returned by explain_dataframe): AMR_Risk_Score,
+    Risk_Category, then one column per model gene."""
+    results = pd.DataFrame(contributions, index=sample_ids, columns=assets.top_genes)
+    results.insert(0, "AMR_Risk_Score", scores.round(3))
+    results.insert(1, "Risk_Category", pd.Series(risk_categories(scores), index=results.index, dtype=str))
+    results.index.name = "Sample_ID"
+    return results
+
+def interpret(mech_profile):
+    if not mech_profile:
+        return "No significant resistance mechanisms detected"
+
+    dominant = max(mech_profile, key=mech_profile.get)
+    dominant_percentage = mech_profile[dominant]
+
+    if dominant_percentage < 0.3:
+        return "Multiple resistance mechanisms contributing equally"
+
+    # Check for Non-Specific Resistance - FIXED
+    # Convert to lowercase for case-insensitive comparison
+    dominant_lower = dominant.lower()
+
+    if "non-specific" in dominant_lower:
+        return "Resistance is dominated by Non-Specific Resistance mechanisms with indirect AMR contribution"
+    elif "β-lactamase" in dominant or "beta-lactamase" in dominant_lower:
+        return "β-lactamase–mediated resistance is prominent"
+    elif "efflux" in dominant_lower:
+        return "Efflux-based multidrug resistance likely"
+    else:
+        return "Mixed resistance mechanisms observed"
@@ -0,0 +1,118 @@
+"""Per-stage timing and memory instrumentation.
+
+StageRecorder wraps named stages of a run and records wall time, CPU time
+of the calling thread and the peak memory allocated while the stage ran
+(via tracemalloc, so it covers Python and NumPy allocations). Thread CPU
+time leaves out other sessions' threads, but also any work NumPy hands to
+BLAS threads. A disabled recorder does nothing and costs nothing, so it
+can be left in place on every code path.
+
+    recorder = StageRecorder(enabled=True)
+    with recorder.stage("read_csv"):
+        df = ...
+    recorder.finish(logger, n_samples=len(df))
+
+tracemalloc is process-wide, so recorders of concurrent sessions share it:
+tracing runs while any recorder needs it, and each peak is an upper bound
+that includes whatever other threads allocated during the stage.
+"""
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger("amr")
+
+_trace_lock = threading.Lock()
+_trace_users = 0            # recorders currently tracing memory
+_started_tracing = False    # tracing was started here, so it is stopped here too
+_open_peaks = {}            # open stage -> highest peak seen before another stage reset it
+
+
+def _acquire_tracing():
+    global _trace_users, _started_tracing
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _trace_users += 1
+
+
+def _release_tracing():
+    global _trace_users, _started_tracing
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+            _open_peaks.clear()
+
+
+def _reset_peak():
+    # The peak is shared: hand it to every open stage before resetting it, so
+    # a stage starting in another session never hides an earlier high point
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    for key, seen in _open_peaks.items():
+        _open_peaks[key] = max(seen, peak_bytes)
+    tracemalloc.reset_peak()
+
+
+class StageRecorder:
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.stages = []
+        self._tracing = self.trace_memory
+        if self._tracing:
+            _acquire_tracing()
+
+    @contextmanager
+    def stage(self, name, **details):
+        if not self.enabled:
+            yield
+            return
+
+        if self._tracing:
+            key = object()
+            with _trace_lock:
+                start_bytes, _ = tracemalloc.get_traced_memory()
+                _reset_peak()
+                _open_peaks[key] = 0
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "wall_s": round(time.perf_counter() - wall_start, 6),
+                "cpu_s": round(time.thread_time() - cpu_start, 6),
+            }
+            if self._tracing:
+                with _trace_lock:
+                    _, peak_bytes = tracemalloc.get_traced_memory()
+                    peak_bytes = max(peak_bytes, _open_peaks.pop(key, 0))
+                record["peak_mb"] = round(max(peak_bytes - start_bytes, 0) / 2**20, 3)
+            record.update(details)
+            self.stages.append(record)
+
+    def note(self, name, **details):
+        """Record a stage that was skipped, e.g. served from cache."""
+        if self.enabled:
+            self.stages.append({"stage": name, "wall_s": 0.0, "cpu_s": 0.0, **details})
+
+    def finish(self, log=logger, **context):
+        """Release memory tracing and write one structured JSON log line for the run."""
+        if self._tracing:
+            _release_tracing()
+            self._tracing = False
+        if not self.enabled:
+            return
+        log.info(json.dumps({
+            "event": "amr_run",
+            **context,
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 6),
+            "stages": self.stages,
+        }, default=str))
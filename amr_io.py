@@ -0,0 +1,381 @@
+"""Reading AMR gene abundance tables.
+
+Abundance tables from MEGARes/ResFinder pipelines carry thousands of gene
+columns while the model uses only TOP_GENES, so the header is read on its own
+first and the body is parsed with just the sample-ID column and the model
+genes.
+
+Long-format (sample, gene, abundance) tables, as emitted by RGI bwt,
+ShortBRED or AMRFinder summaries, are pivoted on the fly by
+read_long_format: only rows for model genes are kept and they are
+accumulated straight into a samples x TOP_GENES array.
+
+Any CSV may be gzip, bz2 or zstd compressed (.gz/.bz2/.zst; zstd needs the
+zstandard package). pandas decompresses it as a stream while parsing, so the
+decompressed text is never held in memory.
+
+Parquet and Arrow IPC (Feather v2) tables are read with column projection
+(see read_columnar), so only the sample-ID column and the model genes are
+ever loaded from disk, and ColumnarWriter streams results tables back out in
+either format. pyarrow is only imported for those.
+
+Mostly-zero tables can instead be supplied as sparse matrices (.npz / .mtx,
+see read_sparse), which are scored without ever being densified. scipy is
+only imported for those.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+SPARSE_EXTENSIONS = (".npz", ".mtx")
+COMPRESSIONS = {".gz": "gzip", ".bz2": "bz2", ".zst": "zstd"}
+COLUMNAR_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+LONG_FORMAT_CHUNKSIZE = 1_000_000
+
+
+def compression_for(name):
+    """pandas compression mode for a file name (None if uncompressed).
+
+    Paths are detected by pandas itself; this is for file objects such as
+    uploads, whose name is known but which pandas cannot inspect.
+    """
+    return COMPRESSIONS.get(os.path.splitext(str(name).lower())[1])
+
+
+def is_compressed(name):
+    return compression_for(name) is not None
+
+
+def read_header(source, compression="infer"):
+    """Column names of a CSV abundance table, read without parsing the body.
+
+    source may be a path or a seekable file object (e.g. a Streamlit upload);
+    file objects are rewound so the body can be read afterwards.
+    """
+    columns = pd.read_csv(source, nrows=0, compression=compression).columns.tolist()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return columns
+
+
+def plan_columns(columns, top_genes):
+    """Work out which columns to parse from the header alone.
+
+    Returns (usecols, missing): the positions of the sample-ID column and of
+    every model gene present, and the model genes absent from the header in
+    TOP_GENES order.
+    """
+    positions = {name: i for i, name in enumerate(columns) if i > 0}
+    missing = [gene for gene in top_genes if gene not in positions]
+    usecols = [0] + sorted(positions[gene] for gene in top_genes if gene in positions)
+    return usecols, missing
+
+
+def read_abundances(source, top_genes, usecols, chunksize=None, names=None, compression="infer", dtype=None):
+    """Parse only the planned columns, returned in TOP_GENES order.
+
+    With chunksize set, yields one DataFrame per chunk instead. Pass the
+    header's column names as names when source starts mid-file (no header
+    row), e.g. a byte-range shard. With dtype (e.g. amr_core.COMPACT_DTYPE)
+    the gene columns are parsed straight into that dtype rather than
+    float64; a cell that is not a number then raises ValueError.
+    """
+    reader = pd.read_csv(
+        source,
+        usecols=usecols,
+        index_col=0,
+        chunksize=chunksize,
+        header=None if names is not None else "infer",
+        names=names,
+        compression=compression,
+        dtype=dict.fromkeys(top_genes, dtype) if dtype is not None else None,
+    )
+    if chunksize is None:
+        return reader[top_genes]
+    return (chunk[top_genes] for chunk in reader)
+
+
+def is_long_format(columns, top_genes):
+    """A three-column table without any model gene in its header may be (sample, gene, abundance).
+
+    Only the header is checked; read_long_format then reports the table as
+    missing every model gene if its gene column names none of them.
+    """
+    return len(columns) == 3 and not set(columns) & set(top_genes)
+
+
+def read_long_format(source, top_genes, chunksize=LONG_FORMAT_CHUNKSIZE, compression="infer"):
+    """Pivot a long (sample, gene, abundance) CSV into a samples x TOP_GENES frame.
+
+    The first three columns are taken as sample ID, gene and abundance,
+    whatever their header names. The file is streamed in chunks; rows for
+    genes outside TOP_GENES are dropped, the rest are located through a
+    gene -> column hash index and summed into a growing samples x 50 array,
+    so no pivot of the full table is ever built. Genes missing for a sample
+    count as zero abundance, and samples that only have non-model genes are
+    kept with all zeros.
+
+    Returns (df, unobserved): the frame in TOP_GENES column order, indexed by
+    sample ID in order of first appearance, and the model genes that never
+    appear in the file. If none of them appears, the table is not a long
+    format table of model genes (e.g. a wide table with two other genes) and
+    df is None, like read_columnar with missing genes.
+    """
+    gene_index = pd.Index(top_genes)
+    observed = np.zeros(len(top_genes), dtype=bool)
+    sample_rows = {}
+    X = np.zeros((1024, len(top_genes)))
+
+    for chunk in pd.read_csv(source, usecols=[0, 1, 2], chunksize=chunksize, compression=compression):
+        codes, uniques = pd.factorize(chunk.iloc[:, 0])
+        chunk_rows = np.fromiter(
+            (sample_rows.setdefault(sample, len(sample_rows)) for sample in uniques),
+            dtype=np.intp, count=len(uniques),
+        )
+        if len(sample_rows) > X.shape[0]:
+            grown = np.zeros((max(len(sample_rows), 2 * X.shape[0]), len(top_genes)))
+            grown[:X.shape[0]] = X
+            X = grown
+
+        cols = gene_index.get_indexer(chunk.iloc[:, 1])
+        keep = (cols >= 0) & (codes >= 0)
+        values = pd.to_numeric(chunk.iloc[:, 2], errors="raise").to_numpy(dtype=float)
+        np.add.at(X, (chunk_rows[codes[keep]], cols[keep]), values[keep])
+        observed[cols[keep]] = True
+
+    unobserved = [gene for gene, seen in zip(top_genes, observed) if not seen]
+    if not observed.any():
+        return None, unobserved
+    df = pd.DataFrame(X[:len(sample_rows)], index=pd.Index(list(sample_rows), name="Sample_ID"), columns=top_genes)
+    return df, unobserved
+
+
+def columnar_format(name):
+    """"parquet" or "arrow" for a columnar file name, None otherwise."""
+    return COLUMNAR_FORMATS.get(os.path.splitext(str(name).lower())[1])
+
+
+def read_columnar(source, top_genes, name=None):
+    """Read a Parquet or Arrow IPC abundance table, projecting to the model genes.
+
+    The schema is read first; the sample-ID column is the pandas index if the
+    file was written from a DataFrame with one, else the first column. Only
+    that column and the model genes are then read from disk.
+
+    Returns (df, missing): the frame in TOP_GENES column order indexed by
+    sample ID (None if genes are missing), and the model genes absent from
+    the schema in TOP_GENES order.
+    """
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    fmt, id_column, columns, missing = _plan_columnar(source, top_genes, name)
+    if missing:
+        return None, missing
+    if fmt == "parquet":
+        table = pyarrow.parquet.read_table(source, columns=columns)
+    else:
+        table = pyarrow.feather.read_table(source, columns=columns)
+    return _columnar_frame(table, id_column, top_genes), missing
+
+
+def iter_columnar(path, top_genes, chunksize):
+    """Stream a Parquet or Arrow IPC file as frames of at most chunksize samples.
+
+    Same projection and layout as read_columnar, but only one batch of rows
+    is decoded at a time: Parquet through ParquetFile.iter_batches, Arrow
+    IPC by memory-mapping the file and reading its record batches one by
+    one. Returns (chunks, missing); chunks is None if genes are missing.
+    """
+    fmt, id_column, columns, missing = _plan_columnar(path, top_genes)
+    if missing:
+        return None, missing
+    return _columnar_chunks(path, fmt, id_column, columns, top_genes, chunksize), missing
+
+
+def _columnar_chunks(path, fmt, id_column, columns, top_genes, chunksize):
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    if fmt == "parquet":
+        # Without pre_buffer, row groups already read are released instead of
+        # staying cached until the whole file has been iterated
+        with pyarrow.parquet.ParquetFile(path, pre_buffer=False) as reader:
+            for batch in reader.iter_batches(batch_size=chunksize, columns=columns):
+                yield _columnar_frame(batch, id_column, top_genes)
+        return
+
+    with pa.memory_map(path) as source, pyarrow.ipc.open_file(source) as reader:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(columns)
+            for start in range(0, batch.num_rows, chunksize):
+                yield _columnar_frame(batch.slice(start, chunksize), id_column, top_genes)
+
+
+def _plan_columnar(source, top_genes, name=None):
+    """(format, sample-ID column, columns to read, missing genes) from the file's schema."""
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    fmt = columnar_format(name if name is not None else source)
+    if fmt == "parquet":
+        schema = pyarrow.parquet.read_schema(source)
+    elif fmt == "arrow":
+        with pyarrow.ipc.open_file(source) as reader:
+            schema = reader.schema
+    else:
+        raise ValueError(f"Not a Parquet/Arrow input: {name or source}")
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+    index_columns = (schema.pandas_metadata or {}).get("index_columns", [])
+    id_column = index_columns[0] if index_columns and isinstance(index_columns[0], str) else schema.names[0]
+    present = set(schema.names)
+    missing = [gene for gene in top_genes if gene not in present]
+    columns = [id_column] + [gene for gene in top_genes if gene != id_column]
+    return fmt, id_column, columns, missing
+
+
+def _columnar_frame(table, id_column, top_genes):
+    """A pyarrow Table or RecordBatch as a frame in TOP_GENES order indexed by sample ID."""
+    ids = table.column(id_column).to_pandas()
+    return pd.DataFrame(
+        {gene: table.column(gene).to_numpy(zero_copy_only=False) for gene in top_genes},
+        index=pd.Index(ids, name=None if id_column.startswith("__index_level_") else id_column),
+    )
+
+
+class ColumnarWriter:
+    """Stream results frames (see amr_core.results_frame) to Parquet or Arrow IPC.
+
+    The schema is fixed up front from an empty template frame, with the
+    Sample_ID index stored as a string column, so chunks scored separately
+    always agree on column types.
+
+        with ColumnarWriter("results.parquet", template) as writer:
+            for results in chunks:
+                writer.write(results)
+    """
+
+    def __init__(self, sink, template, fmt=None):
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        self._pa = pa
+        fmt = fmt or columnar_format(sink)
+        self.schema = pa.Schema.from_pandas(self._prepare(template), preserve_index=False)
+        if fmt == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(sink, self.schema)
+        elif fmt == "arrow":
+            self._writer = pyarrow.ipc.new_file(sink, self.schema)
+        else:
+            raise ValueError(f"Not a Parquet/Arrow output: {sink}")
+
+    @staticmethod
+    def _prepare(results):
+        results = results.reset_index()
+        text = [col for col in results.columns
+                if not (pd.api.types.is_float_dtype(results[col]) or pd.api.types.is_bool_dtype(results[col]))]
+        return results.astype({col: "string" for col in text})
+
+    def write(self, results):
+        table = self._pa.Table.from_pandas(self._prepare(results), schema=self.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def copy_from(self, path):
+        """Append every record batch of a file written by another ColumnarWriter of the same format."""
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if isinstance(self._writer, pyarrow.parquet.ParquetWriter):
+            for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+                self._writer.write_batch(batch)
+        else:
+            with pyarrow.ipc.open_file(path) as reader:
+                for i in range(reader.num_record_batches):
+                    self._writer.write_batch(reader.get_batch(i))
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_sparse_input(name):
+    return str(name).lower().endswith(SPARSE_EXTENSIONS)
+
+
+def read_sparse(source, name=None):
+    """Load a sparse (samples x genes) abundance matrix without densifying it.
+
+    .npz: a scipy.sparse.save_npz archive (CSR or CSC) that also holds a
+          `genes` array of column names and optionally a `samples` array of
+          row IDs (see write_sparse_npz). Works for paths and file objects.
+    .mtx: Matrix Market file with one-name-per-line sidecars next to it,
+          <stem>.genes.txt for columns and optionally <stem>.samples.txt for
+          rows. Paths only.
+
+    Returns (X as CSR float64, genes, sample_ids). Samples without IDs are
+    numbered from 0.
+    """
+    import scipy.io
+    import scipy.sparse
+
+    name = str(name if name is not None else source)
+    if name.lower().endswith(".npz"):
+        with np.load(source, allow_pickle=False) as archive:
+            if "genes" not in archive:
+                raise ValueError("Sparse .npz input must contain a 'genes' array of column names")
+            fmt = archive["format"].item()
+            fmt = fmt.decode() if isinstance(fmt, bytes) else fmt
+            matrix_cls = {"csr": scipy.sparse.csr_matrix, "csc": scipy.sparse.csc_matrix}.get(fmt)
+            if matrix_cls is None:
+                raise ValueError(f"Unsupported sparse format {fmt!r}; expected csr or csc")
+            X = matrix_cls((archive["data"], archive["indices"], archive["indptr"]),
+                           shape=tuple(archive["shape"]))
+            genes = archive["genes"].tolist()
+            sample_ids = archive["samples"].tolist() if "samples" in archive else None
+    elif name.lower().endswith(".mtx"):
+        stem = os.path.splitext(name)[0]
+        X = scipy.io.mmread(source)
+        genes = _read_names(stem + ".genes.txt")
+        samples_path = stem + ".samples.txt"
+        sample_ids = _read_names(samples_path) if os.path.exists(samples_path) else None
+    else:
+        raise ValueError(f"Not a sparse input: {name}")
+
+    X = scipy.sparse.csr_matrix(X, dtype=float)
+    if len(genes) != X.shape[1]:
+        raise ValueError(f"{len(genes)} gene names for a matrix with {X.shape[1]} columns")
+    if sample_ids is None:
+        sample_ids = list(range(X.shape[0]))
+    elif len(sample_ids) != X.shape[0]:
+        raise ValueError(f"{len(sample_ids)} sample IDs for a matrix with {X.shape[0]} rows")
+    return X, genes, sample_ids
+
+
+def write_sparse_npz(path, X, genes, sample_ids=None):
+    """Save a scipy.sparse (samples x genes) matrix in the .npz layout read_sparse expects."""
+    import scipy.sparse
+
+    X = scipy.sparse.csr_matrix(X)
+    arrays = {
+        "data": X.data, "indices": X.indices, "indptr": X.indptr,
+        "format": np.array("csr"), "shape": np.array(X.shape),
+        "genes": np.array(genes, dtype=str),
+    }
+    if sample_ids is not None:
+        arrays["samples"] = np.array(sample_ids, dtype=str)
+    np.savez_compressed(path, **arrays)
+
+
+def _read_names(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
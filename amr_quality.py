@@ -0,0 +1,173 @@
+"""Vectorized data-quality checks for abundance matrices.
+
+validate() looks for non-numeric cells, missing values, infinities,
+negative abundances and duplicated sample IDs with whole-array operations
+and returns a QualityReport: issue counts per gene, the offending rows and
+the first MAX_LOCATIONS offending cells. Clean inputs take a fast path of
+two reductions (min and max), so the check costs milliseconds even for
+millions of samples. resolve() then drops or repairs the bad rows so the
+rest of the file can still be scored.
+
+    X, non_numeric = amr_quality.to_numeric(df)
+    report = amr_quality.validate(X, df.index, top_genes, non_numeric)
+    if not report.ok:
+        X, keep = amr_quality.resolve(X, report, "repair")
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+ISSUES = ("non_numeric", "missing", "infinite", "negative")
+ACTIONS = ("report", "drop", "repair")
+MAX_LOCATIONS = 1000
+
+
+class QualityReport(NamedTuple):
+    n_samples: int
+    counts: pd.DataFrame        # genes x ISSUES, number of affected cells
+    locations: pd.DataFrame     # Sample_ID, Gene, Issue, Value of up to MAX_LOCATIONS cells
+    bad_rows: np.ndarray        # rows with at least one bad cell
+    infinite_rows: np.ndarray   # rows with an infinite cell (dropped even when repairing)
+    duplicate_rows: np.ndarray  # rows repeating an earlier Sample_ID
+    duplicate_ids: pd.Index     # their IDs, up to MAX_LOCATIONS
+
+    @property
+    def ok(self):
+        return len(self.bad_rows) == 0 and len(self.duplicate_rows) == 0
+
+    def summary(self):
+        """Number of affected cells per issue, plus duplicated sample IDs."""
+        totals = {issue: int(self.counts[issue].sum()) for issue in ISSUES}
+        totals["duplicate_id"] = len(self.duplicate_rows)
+        return totals
+
+
+def to_numeric(df):
+    """df as a float array, plus a mask of cells that were not numbers (None if all were).
+
+    Only columns that pandas could not parse as numbers are coerced, one
+    vectorized pd.to_numeric call each; their unparsable cells become NaN.
+    An all-float32 frame (compact mode) stays float32, anything else is float64.
+    """
+    numeric = np.array([pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes], dtype=bool)
+    if numeric.all():
+        compact = len(df.columns) and all(dtype == np.float32 for dtype in df.dtypes)
+        return df.to_numpy(dtype=np.float32 if compact else float), None
+
+    X = np.empty(df.shape)
+    X[:, numeric] = df.iloc[:, numeric].to_numpy(dtype=float)
+    non_numeric = np.zeros(df.shape, dtype=bool)
+    for j in np.flatnonzero(~numeric):
+        column = df.iloc[:, j]
+        coerced = pd.to_numeric(column, errors="coerce").to_numpy(dtype=float)
+        X[:, j] = coerced
+        non_numeric[:, j] = np.isnan(coerced) & column.notna().to_numpy()
+    return X, non_numeric
+
+
+def validate(X, sample_ids, genes, non_numeric=None):
+    """Check abundances X (samples x genes, dense or scipy.sparse) and their sample IDs.
+
+    non_numeric is the mask from to_numeric; those cells are NaN in X and are
+    reported as non_numeric rather than missing.
+    """
+    n_samples, n_genes = X.shape
+    sample_ids = pd.Index(sample_ids)
+    duplicate_rows = np.flatnonzero(sample_ids.duplicated(keep="first"))
+    duplicate_ids = sample_ids[duplicate_rows[:MAX_LOCATIONS]]
+    empty = np.array([], dtype=np.intp)
+
+    sparse = hasattr(X, "tocsr")
+    if sparse:
+        X = X.tocsr()
+        values = X.data
+    else:
+        values = X
+    if values.size == 0 or (non_numeric is None and values.min() >= 0 and np.isfinite(values.max())):
+        counts = pd.DataFrame(0, index=pd.Index(genes, name="Gene"), columns=list(ISSUES))
+        return QualityReport(n_samples, counts, _locations(sample_ids, genes, empty, empty, empty, np.array([])),
+                             empty, empty, duplicate_rows, duplicate_ids)
+
+    if sparse:
+        # Only stored entries can be invalid; classify them all
+        rows = np.repeat(np.arange(n_samples), np.diff(X.indptr))
+        code = _issue_codes(values)
+        flagged = np.flatnonzero(code)
+        counts = {issue: np.bincount(X.indices[flagged[code[flagged] == k]], minlength=n_genes)
+                  for k, issue in enumerate(ISSUES, 1)}
+        bad_rows = np.unique(rows[flagged])
+        infinite_rows = np.unique(rows[flagged[code[flagged] == 3]])
+        shown = flagged[:MAX_LOCATIONS]
+        locations = _locations(sample_ids, genes, rows[shown], X.indices[shown], code[shown], values[shown])
+    else:
+        # NaN propagates through the row minimum, as do negatives; +inf shows up in the
+        # row maximum. Only the rows flagged here are classified cell by cell.
+        bad_rows = np.flatnonzero(~((X.min(axis=1) >= 0) & (X.max(axis=1) < np.inf)))
+        sub = X[bad_rows]
+        code = _issue_codes(sub, non_numeric[bad_rows] if non_numeric is not None else None)
+        counts = {issue: np.count_nonzero(code == k, axis=0) for k, issue in enumerate(ISSUES, 1)}
+        infinite_rows = bad_rows[(code == 3).any(axis=1)]
+        shown = np.flatnonzero(code)[:MAX_LOCATIONS]
+        shown_rows, shown_cols = np.divmod(shown, n_genes)
+        locations = _locations(sample_ids, genes, bad_rows[shown_rows], shown_cols, code.ravel()[shown],
+                               sub.ravel()[shown])
+
+    counts = pd.DataFrame(counts, index=pd.Index(genes, name="Gene"))
+    return QualityReport(n_samples, counts, locations, bad_rows, infinite_rows, duplicate_rows, duplicate_ids)
+
+
+def _issue_codes(values, non_numeric=None):
+    """One code per cell: 0 = valid, k = ISSUES[k - 1]. The issues are mutually exclusive."""
+    nan = np.isnan(values)
+    infinite = np.isinf(values)
+    code = np.zeros(values.shape, dtype=np.int8)
+    code[nan] = 2
+    if non_numeric is not None:
+        code[non_numeric] = 1
+    code[infinite] = 3
+    code[(values < 0) & ~infinite] = 4
+    return code
+
+
+def _locations(sample_ids, genes, rows, cols, codes, values):
+    return pd.DataFrame({
+        "Sample_ID": sample_ids[rows] if len(rows) else pd.Index([], dtype=object),
+        "Gene": np.asarray(genes, dtype=object)[cols],
+        "Issue": np.asarray(ISSUES, dtype=object)[codes - 1] if len(codes) else np.array([], dtype=object),
+        "Value": values,
+    })
+
+
+def resolve(X, report, action):
+    """Apply "drop" or "repair" to X; returns (X, keep) where keep masks the surviving rows.
+
+    drop:   remove every row with a bad cell and every repeated sample ID.
+    repair: set non-numeric, missing and negative cells to zero abundance;
+            rows with infinities and repeated sample IDs are still removed,
+            as there is no sensible value to put in their place.
+    The first occurrence of a duplicated sample ID is always kept.
+    """
+    if action not in ("drop", "repair"):
+        raise ValueError(f"Unknown action {action!r}; expected 'drop' or 'repair'")
+
+    keep = np.ones(report.n_samples, dtype=bool)
+    keep[report.duplicate_rows] = False
+    keep[report.bad_rows if action == "drop" else report.infinite_rows] = False
+    X = X[keep]
+
+    if action == "repair":
+        if hasattr(X, "tocsr"):
+            values = X.data
+            values[np.isnan(values)] = 0.0
+            np.maximum(values, 0.0, out=values)
+            X.eliminate_zeros()
+        else:
+            # Only rows that had bad cells need fixing, at their positions after the row selection
+            rows = report.bad_rows[keep[report.bad_rows]]
+            rows = (np.cumsum(keep) - 1)[rows]
+            sub = X[rows]
+            sub[np.isnan(sub)] = 0.0
+            np.maximum(sub, 0.0, out=sub)
+            X[rows] = sub
+    return X, keep
@@ -0,0 +1,260 @@
+"""Local HTTP scoring service for the AMR burden model.
+
+Built on the standard library only. Concurrent requests are coalesced into
+micro-batches: the first request to arrive opens a window of --max-wait-ms,
+every request that lands inside it is stacked into one matrix, scored with a
+single fused dot product + mechanism-profile multiply, and each caller gets
+back its own rows.
+
+    python amr_server.py --port 8000 --max-wait-ms 5
+
+Endpoints:
+    GET  /health   {"status": "ok", "model_version": ...}
+    POST /score    JSON or CSV samples -> list of per-sample results
+
+JSON bodies are one sample or a list of samples, each an object mapping gene
+names to abundances with an optional "Sample_ID". CSV bodies
+(Content-Type: text/csv) use the same layout as the app upload: samples as
+rows, first column Sample_ID.
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+
+import amr_core
+import amr_io
+
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_BATCH = 4096
+
+
+class _Pending:
+    __slots__ = ("X", "sample_ids", "done", "results", "error")
+
+    def __init__(self, X, sample_ids):
+        self.X = X
+        self.sample_ids = sample_ids
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Coalesce concurrent scoring calls into batched matrix products.
+
+    score() blocks the calling thread until its rows have been scored by the
+    background worker. A batch closes when max_wait_ms has passed since its
+    first request or once it holds max_batch rows.
+    """
+
+    def __init__(self, assets, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.assets = assets
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="amr-micro-batcher", daemon=True)
+        self._worker.start()
+
+    def score(self, X, sample_ids):
+        pending = _Pending(X, sample_ids)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.results
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            n_rows = len(batch[0].X)
+            deadline = time.perf_counter() + self.max_wait
+            while n_rows < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                n_rows += len(pending.X)
+            self._score_batch(batch)
+
+    def _score_batch(self, batch):
+        try:
+            results = self._score(np.vstack([pending.X for pending in batch]),
+                                  [sample_id for pending in batch for sample_id in pending.sample_ids])
+        except Exception:
+            # Score each request on its own so only the caller whose input fails gets the error
+            for pending in batch:
+                try:
+                    pending.results = self._score(pending.X, pending.sample_ids)
+                except Exception as e:
+                    pending.error = e
+                pending.done.set()
+            return
+
+        self.batches += 1
+        start = 0
+        for pending in batch:
+            stop = start + len(pending.X)
+            pending.results = results[start:stop]
+            pending.done.set()
+            start = stop
+
+    def _score(self, X, sample_ids):
+        assets = self.assets
+        scores = amr_core.score_array(X, assets.weights, assets.bias)
+        profiles = amr_core.mechanism_profiles(X, assets.mech_matrix)
+        categories = amr_core.risk_categories(scores)
+        # The ood_frame fields straight from the arrays; a DataFrame per batch costs more than the scoring
+        distance, max_abs_z, max_gene = amr_core.ood_statistics(X, assets.mean, assets.scale)
+        rms_limit, z_limit = amr_core.OOD_THRESHOLDS
+        flags = ((distance > rms_limit) | (max_abs_z > z_limit)).tolist()
+        distance, max_abs_z = distance.round(3).tolist(), max_abs_z.round(3).tolist()
+        top_genes = assets.top_genes
+        return [
+            amr_core.sample_result(sample_id, scores[i], profiles[i], assets.mechanisms, categories[i], {
+                "OOD_Flag": flags[i],
+                "OOD_Distance": distance[i],
+                "Max_Abs_Z": max_abs_z[i],
+                "Max_Z_Gene": top_genes[max_gene[i]],
+            })
+            for i, sample_id in enumerate(sample_ids)
+        ]
+
+
+def parse_json_samples(body, top_genes):
+    """Turn a JSON body into (X, sample_ids); raises ValueError on bad input."""
+    payload = json.loads(body)
+    records = payload if isinstance(payload, list) else [payload]
+    if not records or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a sample object or a non-empty list of sample objects")
+
+    missing = [gene for gene in top_genes if any(gene not in r for r in records)]
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+
+    try:
+        X = np.array([[r[gene] for gene in top_genes] for r in records], dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError("Every gene abundance must be a single number") from None
+    sample_ids = [r.get("Sample_ID", i) for i, r in enumerate(records)]
+    return _check_abundances(X, top_genes), sample_ids
+
+
+def parse_csv_samples(body, top_genes):
+    """Turn a CSV body into (X, sample_ids); raises ValueError on bad input."""
+    source = BytesIO(body)
+    usecols, missing = amr_io.plan_columns(amr_io.read_header(source), top_genes)
+    if missing:
+        raise ValueError(f"Missing {len(missing)} required genes, e.g. {missing[:5]}")
+    df = amr_io.read_abundances(source, top_genes, usecols)
+    try:
+        X = df.to_numpy(dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError("Every gene abundance must be a single number") from None
+    return _check_abundances(X, top_genes), df.index.tolist()
+
+
+def _check_abundances(X, top_genes):
+    """X if it is a finite (samples x TOP_GENES) matrix; raises ValueError otherwise."""
+    if X.ndim != 2 or X.shape[1] != len(top_genes):
+        raise ValueError(f"Expected one number per gene for each sample, got an array of shape {X.shape}")
+    if not np.isfinite(X).all():
+        rows, cols = np.nonzero(~np.isfinite(X))
+        raise ValueError(f"{len(rows)} abundances are missing or not finite, "
+                         f"e.g. sample {rows[0]}, gene {top_genes[cols[0]]}")
+    return X
+
+
+def make_handler(batcher):
+    top_genes = batcher.assets.top_genes
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path != "/health":
+                self._send_json(404, {"error": "Not found"})
+                return
+            self._send_json(200, {"status": "ok", "model_version": batcher.assets.version})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send_json(404, {"error": "Not found"})
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            content_type = self.headers.get("Content-Type", "application/json")
+            try:
+                if content_type.startswith("text/csv"):
+                    X, sample_ids = parse_csv_samples(body, top_genes)
+                else:
+                    X, sample_ids = parse_json_samples(body, top_genes)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            try:
+                results = batcher.score(X, sample_ids)
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, results)
+
+        def _send_json(self, status, payload):
+            try:
+                data = json.dumps(payload, allow_nan=False).encode("utf-8")
+            except ValueError:
+                status, data = 500, json.dumps({"error": "Result contains a non-finite number"}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def make_server(assets, host="127.0.0.1", port=8000, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                max_batch=DEFAULT_MAX_BATCH):
+    batcher = MicroBatcher(assets, max_wait_ms, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    server.daemon_threads = True
+    server.batcher = batcher
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve AMR burden scores over HTTP with request micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help=f"How long a batch stays open for more requests (default: {DEFAULT_MAX_WAIT_MS})")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help=f"Rows at which a batch is scored without waiting (default: {DEFAULT_MAX_BATCH})")
+    args = parser.parse_args(argv)
+
+    server = make_server(amr_core.load_assets(), args.host, args.port, args.max_wait_ms, args.max_batch)
+    print(f"Serving AMR scores on http://{args.host}:{args.port}/score", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
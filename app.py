@@ -1,12 +1,20 @@
 import streamlit as st
 import pandas as pd
-import joblib
 import json
-import matplotlib.pyplot as plt
-import matplotlib
 import numpy as np
-from io import StringIO
-matplotlib.use("Agg")
+import hashlib
+import logging
+import os
+import zipfile
+from collections import deque
+from io import BytesIO
+from typing import NamedTuple
+import amr_charts
+import amr_core
+import amr_io
+import amr_quality
+from amr_core import interpret
+from amr_diagnostics import StageRecorder
 
 # --------------------------------------------------
 # Page config with better styling
@@ -106,6 +114,8 @@ with st.sidebar:
     st.markdown("**Model Type:** Huber Regressor")
     st.markdown("**Features:** 50 key AMR genes")
     st.markdown("**Scaler:** StandardScaler (trained on top 50 genes)")
+    low, high = amr_core.RISK_THRESHOLDS
+    st.markdown(f"**Risk thresholds:** Low < {low:,.0f} ≤ Moderate < {high:,.0f} ≤ High")
     
     st.markdown("## ⚠️ Important Notes")
     st.warning("""
@@ -113,13 +123,12 @@ with st.sidebar:
     - Results should be interpreted by qualified professionals
     - Always validate predictions with clinical data
     """)
-
-# --------------------------------------------------
-# Paths
-# --------------------------------------------------
-MODEL_PATH = "huber_amr_model.pkl"
-SCALER_PATH = "scaler_top50.pkl"
-GENE_INFO_PATH = "top50_shap_genes_annotated.csv"
+    
+    show_diagnostics = st.checkbox(
+        "🩺 Show diagnostics",
+        value=os.environ.get("AMR_DIAGNOSTICS", "") == "1",
+        help="Time each processing stage (wall, CPU, peak memory) and log one JSON line per run"
+    )
 
 # --------------------------------------------------
 # Load model & metadata
@@ -127,67 +136,74 @@ GENE_INFO_PATH = "top50_shap_genes_annotated.csv"
 @st.cache_resource
 def load_assets():
     try:
-        model = joblib.load(MODEL_PATH)
-        scaler = joblib.load(SCALER_PATH)
-        gene_info = pd.read_csv(GENE_INFO_PATH)
-        
-        # Exact pattern replacement for the specific format in your image
-        # First, let's standardize all variations to "Non-Specific Resistance"
-        
-        # Create a mapping of patterns to replace
-        replace_dict = {
-            "Other / Unclassified": "Non-Specific Resistance",
-            "Other/Unclassified": "Non-Specific Resistance", 
-            "Other /Unclassified": "Non-Specific Resistance",
-            "Other/ Unclassified": "Non-Specific Resistance",
-            "general/Unknown": "Non-Specific Resistance",
-            "general / Unknown": "Non-Specific Resistance",
-            "Other": "Non-Specific Resistance",
-            "Unclassified": "Non-Specific Resistance",
-            "Unknown": "Non-Specific Resistance",
-            "Non-specific": "Non-Specific Resistance",
-            "non-specific": "Non-Specific Resistance"
-        }
-        
-        # Apply the replacement
-        gene_info["Resistance_Mechanism"] = gene_info["Resistance_Mechanism"].replace(replace_dict)
-        
-        # Also do a case-insensitive check for any remaining variations
-        def final_cleanup(mechanism):
-            mech = str(mechanism).strip()
-            # Check if it contains any of our target words (case insensitive)
-            if any(word in mech.lower() for word in ["other", "unclassified", "unknown", "non-specific", "general"]):
-                return "Non-Specific Resistance"
-            return mech
-        
-        gene_info["Resistance_Mechanism"] = gene_info["Resistance_Mechanism"].apply(final_cleanup)
-        
-        return model, scaler, gene_info
+        return amr_core.load_assets()
     except Exception as e:
         st.error(f"Error loading model assets: {str(e)}")
-        return None, None, None
+        return None
 
-model, scaler, gene_info = load_assets()
+assets = load_assets()
 
-if model is None:
+if assets is None:
     st.stop()
 
-TOP_GENES = gene_info["AMR_Gene"].tolist()
-GENE_TO_MECH = dict(zip(
-    gene_info["AMR_Gene"],
-    gene_info["Resistance_Mechanism"]
-))
+TOP_GENES = assets.top_genes
+MECH_MATRIX = assets.mech_matrix
+MECHANISMS = assets.mechanisms
+WEIGHTS = assets.weights
+BIAS = assets.bias
+GENE_MECHANISMS = assets.gene_info["Resistance_Mechanism"].to_numpy()
+
+# Genes listed per sample in the driver table
+TOP_DRIVERS = 5
+
+@st.cache_resource
+def load_ensemble():
+    try:
+        return amr_core.load_ensemble(assets)
+    except Exception as e:
+        st.error(f"Error loading the bootstrap ensemble: {str(e)}")
+        return None
+
+ensemble = load_ensemble()
+
+with st.sidebar:
+    show_uncertainty = st.checkbox(
+        "🎯 Show uncertainty",
+        value=False,
+        disabled=ensemble is None,
+        help=(f"Score intervals and risk-category probabilities from {ensemble.n_models} bootstrap refits"
+              if ensemble is not None else
+              "Needs a bootstrap ensemble; create one with `python amr_artifact.py ensemble`")
+    )
+    compact_mode = st.checkbox(
+        "🗜️ Compact float32 mode",
+        value=os.environ.get("AMR_COMPACT", "") == "1",
+        help="Parse and score abundances as float32, roughly halving memory for large cohorts. "
+             "Each score comes with an error bound against float64. Samples near a risk threshold are "
+             "rescored in float64, but from float32-rounded abundances, so one within that rounding of a "
+             "threshold can still fall on the other side."
+    )
+
+# Samples serialized per chunk by the batch exports
+EXPORT_CHUNKSIZE = 10_000
+
+# Scored uploads, keyed on content hash + artifact version and shared across
+# sessions, so widget reruns don't re-parse and re-score the same file
+RESULT_CACHE_MB = int(os.environ.get("AMR_RESULT_CACHE_MB", "512"))
+
+@st.cache_resource
+def get_result_cache():
+    return amr_core.ResultCache(max_bytes=RESULT_CACHE_MB * 1024 * 1024)
+
+# Per-run diagnostics are logged as one JSON line on the "amr" logger (stderr)
+amr_logger = logging.getLogger("amr")
+if not amr_logger.handlers:
+    amr_logger.addHandler(logging.StreamHandler())
+    amr_logger.setLevel(logging.INFO)
 
 # --------------------------------------------------
-# Helper functions - FIXED INTERPRET FUNCTION
+# Helper functions
 # --------------------------------------------------
-def risk_category(score):
-    if score < 3e6:
-        return "Low"
-    elif score < 5e6:
-        return "Moderate"
-    return "High"
-
 def get_risk_color(category):
     if category == "Low":
         return "risk-low"
@@ -195,42 +211,383 @@ def get_risk_color(category):
         return "risk-moderate"
     return "risk-high"
 
-def compute_sample_mechanisms(sample):
-    mech_scores = {}
-    for gene, value in sample.items():
-        mech = GENE_TO_MECH.get(gene, "Non-Specific Resistance")
-        mech_scores[mech] = mech_scores.get(mech, 0) + value
-    
-    total = sum(mech_scores.values())
-    if total > 0:
-        return {k: round(v / total, 3) for k, v in mech_scores.items()}
-    return {k: 0 for k in mech_scores}
-
-def interpret(mech_profile):
-    if not mech_profile:
-        return "No significant resistance mechanisms detected"
-    
-    dominant = max(mech_profile, key=mech_profile.get)
-    dominant_percentage = mech_profile[dominant]
-    
-    # Debug: Show what we're working with
-    # st.write(f"DEBUG: Dominant mechanism = '{dominant}' ({dominant_percentage:.1%})")
-    
-    if dominant_percentage < 0.3:
-        return "Multiple resistance mechanisms contributing equally"
-    
-    # Check for Non-Specific Resistance - FIXED
-    # Convert to lowercase for case-insensitive comparison
-    dominant_lower = dominant.lower()
-    
-    if "non-specific" in dominant_lower:
-        return "Resistance is dominated by Non-Specific Resistance mechanisms with indirect AMR contribution"
-    elif "β-lactamase" in dominant or "beta-lactamase" in dominant_lower:
-        return "β-lactamase–mediated resistance is prominent"
-    elif "efflux" in dominant_lower:
-        return "Efflux-based multidrug resistance likely"
+def mechanism_profiles(X):
+    return amr_core.mechanism_profiles(X, MECH_MATRIX)
+
+def profile_dict(profile_row):
+    return amr_core.profile_dict(profile_row, MECHANISMS)
+
+def render_sample(i, sample_id, sample_score, risk_cat, profile_row, contribution_row, cohort, ood_row,
+                  uncertainty_row=None):
+    risk_color = get_risk_color(risk_cat)
+
+    mech_profile = profile_dict(profile_row)
+
+    # Create a clean results display
+    with st.container():
+        st.markdown(f"### 🧪 Sample: `{sample_id}`")
+
+        # Metrics in columns
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.markdown(f"**AMR Burden Score**")
+            st.markdown(f"<h2 style='margin-top:0;'>{sample_score:,.2f}</h2>", unsafe_allow_html=True)
+            st.caption(f"Cohort median {cohort['score_quantiles']['P50']:,.0f}")
+
+        with col2:
+            st.markdown(f"**Risk Category**")
+            st.markdown(f"<h3 class='{risk_color}'>{risk_cat}</h3>", unsafe_allow_html=True)
+
+        with col3:
+            st.markdown(f"**Interpretation**")
+            st.info(interpret(mech_profile))
+
+        if ood_row["OOD_Flag"]:
+            st.warning(
+                f"⚠️ Outside the model's training distribution (RMS z {ood_row['OOD_Distance']:.2f}, "
+                f"max |z| {ood_row['Max_Abs_Z']:.1f} for `{ood_row['Max_Z_Gene']}`); "
+                "interpret this score with caution."
+            )
+
+        if uncertainty_row is not None:
+            probabilities = " · ".join(f"{c}: {uncertainty_row[f'P_{c}']:.0%}" for c in amr_core.RISK_CATEGORIES)
+            st.markdown(
+                f"**90% interval ({ensemble.n_models} bootstrap models):** "
+                f"{uncertainty_row['Score_P05']:,.2f} – {uncertainty_row['Score_P95']:,.2f} &nbsp;|&nbsp; "
+                f"**Risk category probability:** {probabilities}"
+            )
+
+        # Resistance Mechanism Profile
+        st.markdown("##### Resistance Mechanism Profile")
+
+        # Create a better visualization
+        col1, col2 = st.columns([2, 3])
+
+        with col1:
+            # Mechanism table
+            mech_df = pd.DataFrame({
+                'Mechanism': list(mech_profile.keys()),
+                'Proportion': list(mech_profile.values())
+            }).sort_values('Proportion', ascending=False)
+
+            # Format for display
+            mech_df['Proportion'] = mech_df['Proportion'].apply(lambda x: f"{x:.1%}")
+            st.dataframe(
+                mech_df,
+                width="stretch",
+                hide_index=True
+            )
+
+        with col2:
+            # Rendered in the browser from a Vega-Lite spec
+            st.altair_chart(amr_charts.mechanism_chart(mech_profile), width="stretch")
+
+        # Genes that moved this sample's score the most, in either direction
+        st.markdown(f"##### Top {TOP_DRIVERS} Gene Drivers")
+        top = amr_core.top_contributions(contribution_row, TOP_DRIVERS)[0]
+        st.dataframe(
+            pd.DataFrame({
+                'Gene': np.array(TOP_GENES)[top],
+                'Mechanism': GENE_MECHANISMS[top],
+                'Contribution': contribution_row[top].round(3),
+                'Share of |Total|': (np.abs(contribution_row[top]) / max(np.abs(contribution_row).sum(), 1e-12))
+                    .round(3),
+            }),
+            width="stretch",
+            hide_index=True
+        )
+        st.caption("Contribution = coefficient × standardized abundance; the contributions of all "
+                   f"{len(TOP_GENES)} genes plus the model intercept add up to the AMR score.")
+
+        # Raw JSON in expander (for users who need it)
+        with st.expander("📋 View Raw JSON Output"):
+            output = amr_core.sample_result(sample_id, sample_score, profile_row, MECHANISMS, risk_cat, ood_row)
+            st.code(json.dumps(output, indent=2), language="json")
+
+        # Download button for this sample's results, serialized only when clicked
+        st.download_button(
+            label=f"📥 Download Results for {sample_id}",
+            data=lambda: json.dumps(output, indent=2),
+            file_name=f"amr_results_{sample_id}.json",
+            mime="application/json",
+            key=f"download_{i}"
+        )
+
+        st.divider()
+
+ISSUE_LABELS = {
+    "non_numeric": "non-numeric cells",
+    "missing": "missing values",
+    "infinite": "infinite values",
+    "negative": "negative abundances",
+    "duplicate_id": "duplicated sample IDs",
+}
+INVALID_ACTIONS = {
+    "report": "Stop and show the report",
+    "drop": "Drop affected samples",
+    "repair": "Repair (missing, non-numeric and negative → 0; drop infinite and duplicated)",
+}
+
+def render_quality_report(report, n_kept=None):
+    """Issue counts, the first offending cells and the drop/repair choice.
+
+    n_kept is the number of samples scored after resolving, None if the run stopped.
+    """
+    found = ", ".join(f"{n:,} {ISSUE_LABELS[issue]}" for issue, n in report.summary().items() if n)
+    n_affected = len(np.union1d(report.bad_rows, report.duplicate_rows))
+    if n_kept is None:
+        st.error(f"❌ {n_affected:,} of {report.n_samples:,} samples have invalid data: {found}")
+    else:
+        st.warning(f"⚠️ {n_affected:,} samples had invalid data ({found}); "
+                   f"{report.n_samples - n_kept:,} were removed before scoring")
+
+    st.radio("How should invalid samples be handled?", list(INVALID_ACTIONS),
+             format_func=INVALID_ACTIONS.get, key="on_invalid", horizontal=True)
+
+    with st.expander("🔍 Data Quality Report", expanded=n_kept is None):
+        counts = report.counts[report.counts.to_numpy().any(axis=1)]
+        if len(counts):
+            st.markdown("**Invalid cells per gene**")
+            st.dataframe(counts, width="stretch")
+            st.markdown(f"**Invalid cells** (first {len(report.locations):,})")
+            st.dataframe(report.locations, width="stretch", hide_index=True)
+        if len(report.duplicate_rows):
+            st.markdown(f"**Duplicated sample IDs** ({len(report.duplicate_rows):,} repeats; the first occurrence is kept)")
+            st.write(", ".join(map(str, report.duplicate_ids[:50])))
+
+def deferred_export(write, file_name, diagnostics=False, stages=None):
+    """Download-button data that is only produced when the button is clicked.
+
+    write(out) streams the export into a binary buffer chunk by chunk, so no
+    intermediate records, DataFrame or full-size string is ever built. The
+    export is timed when it actually runs, on Streamlit's download thread:
+    with diagnostics on, it is logged as its own run and appended to stages
+    for the diagnostics panel of the next rerun.
+    """
+    def build():
+        recorder = StageRecorder(enabled=diagnostics)
+        out = BytesIO()
+        try:
+            with recorder.stage("batch_export", file_name=file_name):
+                write(out)
+        finally:
+            recorder.finish(export=file_name)
+        if stages is not None:
+            stages.extend(recorder.stages)
+        return out
+    return build
+
+def write_text_chunks(chunks):
+    def write(out):
+        for chunk in chunks():
+            out.write(chunk.encode("utf-8"))
+    return write
+
+def write_json_bundle(sample_ids, scores, categories, profiles, ood):
+    """Zip archive with one indented JSON file per sample, as the per-sample downloads produce.
+
+    Sample IDs are made path-safe, which can make two of them equal ("a/b"
+    and "a_b"), and some file systems ignore case; a repeated name gets the
+    sample's row number appended so no entry overwrites another.
+    """
+    def write(out):
+        used = set()
+        with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            for i, (sample_id, sample_ood) in enumerate(zip(sample_ids.tolist(), ood.to_dict("records"))):
+                output = amr_core.sample_result(sample_id, scores[i], profiles[i], MECHANISMS, categories[i], sample_ood)
+                name = str(sample_id).replace("/", "_").replace("\\", "_")
+                while name.casefold() in used:
+                    name = f"{name}_{i}"
+                used.add(name.casefold())
+                bundle.writestr(f"amr_results_{name}.json", json.dumps(output, indent=2))
+    return write
+
+def sample_contributions(abundances, rows):
+    """Per-gene contributions (see amr_core.gene_contributions) of abundances[rows], in float64.
+
+    Only the requested rows are densified, so contributions are computed for
+    the visible page or one export chunk at a time instead of being cached.
+    """
+    X = abundances[rows]
+    X = X.toarray() if hasattr(X, "toarray") else X
+    return amr_core.gene_contributions(X.astype(float, copy=False), WEIGHTS, assets.mean)
+
+class UploadResult(NamedTuple):
+    missing: list
+    sample_ids: pd.Index = None
+    scores: np.ndarray = None
+    profiles: np.ndarray = None
+    # Model-gene abundances for contributions: sparse uploads stay sparse,
+    # dense ones are kept as float32 to halve the cache entry
+    abundances: np.ndarray = None
+    summary_df: pd.DataFrame = None
+    unobserved_genes: list = ()
+    uncertainty: pd.DataFrame = None
+    categories: np.ndarray = None
+    cohort: dict = None
+    quality: amr_quality.QualityReport = None
+    score_bound: float = None
+    ood: pd.DataFrame = None
+
+    @property
+    def nbytes(self):
+        if self.missing or self.scores is None:
+            return 1024
+        return (
+            self.sample_ids.memory_usage(deep=True)
+            + self.scores.nbytes
+            + self.profiles.nbytes
+            + self.categories.nbytes
+            + (sum(a.nbytes for a in (self.abundances.data, self.abundances.indices, self.abundances.indptr))
+               if hasattr(self.abundances, "tocsr") else self.abundances.nbytes)
+            + int(self.summary_df.memory_usage(deep=True).sum())
+            + int(self.ood.memory_usage().sum())
+            + (int(self.uncertainty.memory_usage().sum()) if self.uncertainty is not None else 0)
+        )
+
+def upload_digest(uploaded_file):
+    """SHA-256 of the upload's bytes, computed once per uploaded file."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests.clear()
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[uploaded_file.file_id]
+
+def analyze_upload(uploaded_file, recorder, ensemble=None, on_invalid="report", compact=False):
+    """Parse, validate, score and profile an upload, reusing the cached result if any.
+
+    Invalid values stop the run with a quality report unless on_invalid is
+    "drop" or "repair" (see amr_quality.resolve). With an ensemble, score
+    intervals and category probabilities are added. compact parses and
+    scores in float32 (see amr_core.compact_scores).
+    """
+    cache = get_result_cache()
+    with recorder.stage("hash_upload"):
+        key = (upload_digest(uploaded_file), assets.version, ensemble.version if ensemble is not None else None,
+               on_invalid, compact)
+    result = cache.get(key)
+    if result is not None:
+        recorder.note("analyze", cached=True)
+        return result
+
+    # Compressed uploads stay compressed in memory and are decompressed while parsing
+    source = BytesIO(uploaded_file.getvalue())
+    compression = amr_io.compression_for(uploaded_file.name)
+    unobserved_genes = []
+    non_numeric = None
+    if amr_io.columnar_format(uploaded_file.name):
+        # Parquet / Arrow IPC: read only the sample-ID column and the model genes
+        with recorder.stage("read_columnar"):
+            df, missing = amr_io.read_columnar(source, TOP_GENES, uploaded_file.name)
+        if not missing:
+            with recorder.stage("to_numeric"):
+                X, non_numeric = amr_quality.to_numeric(df)
+            sample_index = df.index
+    elif amr_io.is_sparse_input(uploaded_file.name):
+        # Sparse matrix: keep only the model gene columns, without densifying
+        with recorder.stage("read_sparse"):
+            X, genes, ids = amr_io.read_sparse(source, uploaded_file.name)
+        gene_set = set(genes)
+        missing = [gene for gene in TOP_GENES if gene not in gene_set]
+        if not missing:
+            X = X[:, pd.Index(genes).get_indexer(TOP_GENES)]
+            sample_index = pd.Index(ids)
+    else:
+        # Check for required genes from the header before parsing the body
+        with recorder.stage("gene_check"):
+            columns = amr_io.read_header(source, compression)
+            long_format = amr_io.is_long_format(columns, TOP_GENES)
+            if long_format:
+                missing = []
+            else:
+                usecols, missing = amr_io.plan_columns(columns, TOP_GENES)
+        if long_format:
+            # (sample, gene, abundance) rows pivoted on the fly into samples x 50
+            with recorder.stage("read_long_format"):
+                df, unobserved_genes = amr_io.read_long_format(source, TOP_GENES, compression=compression)
+            if df is None:
+                # No row names a model gene: a three-column wide table, not long format
+                missing, unobserved_genes = unobserved_genes, []
+            else:
+                X = df.to_numpy()
+                sample_index = df.index
+        elif not missing:
+            # Parse only the sample-ID column and the model genes
+            with recorder.stage("read_csv", compact=compact):
+                try:
+                    df = amr_io.read_abundances(source, TOP_GENES, usecols, compression=compression,
+                                                dtype=amr_core.COMPACT_DTYPE if compact else None)
+                except ValueError:
+                    # A cell that is not a number: parse as usual so validation can locate it
+                    source.seek(0)
+                    df = amr_io.read_abundances(source, TOP_GENES, usecols, compression=compression)
+            with recorder.stage("to_numeric"):
+                X, non_numeric = amr_quality.to_numeric(df)
+            sample_index = df.index
+
+    # From here X holds the model genes only, in TOP_GENES order
+    if not missing:
+        with recorder.stage("validate"):
+            # NaN, inf, negative and non-numeric cells and duplicated IDs, in whole-array passes
+            quality = amr_quality.validate(X, sample_index, TOP_GENES, non_numeric)
+        if not quality.ok and on_invalid != "report":
+            with recorder.stage("resolve_invalid", action=on_invalid):
+                X, keep = amr_quality.resolve(X, quality, on_invalid)
+                sample_index = sample_index[keep]
+        if compact:
+            # A no-op for CSVs, which are parsed straight into float32
+            X = X.astype(amr_core.COMPACT_DTYPE, copy=False)
+
+    if missing:
+        result = UploadResult(missing)
+    elif not quality.ok and (on_invalid == "report" or not len(sample_index)):
+        # Nothing to score: either the user has not chosen how to handle invalid
+        # samples yet, or the chosen action removed every one of them
+        result = UploadResult(missing, sample_index, quality=quality)
     else:
-        return "Mixed resistance mechanisms observed"
+        # Fused transform + predict
+        with recorder.stage("score"):
+            if compact:
+                # float32 scores plus a bound on their distance from the float64 scores
+                scores, score_bound = amr_core.compact_scores(X, WEIGHTS, BIAS)
+                score_bound = float(score_bound.max(initial=0.0))
+            else:
+                scores, score_bound = amr_core.score_array(X, WEIGHTS, BIAS), None
+            # Distance from the scaler's training mean/scale, one cache-sized chunk at a time
+            ood = amr_core.ood_frame(X, assets)
+            # One binning pass feeds the summary table, metrics, sample views and exports
+            codes = amr_core.risk_codes(scores)
+            categories = np.asarray(amr_core.RISK_CATEGORIES, dtype=object)[codes]
+            cohort = amr_core.cohort_summary(scores, codes, ood_flags=ood["OOD_Flag"].to_numpy())
+        with recorder.stage("mechanism_profiles"):
+            profiles = amr_core.mechanism_profiles(X, MECH_MATRIX)
+        with recorder.stage("top_drivers"):
+            # Exact for the linear model: weights_j * (x_ij - mean_j) per gene, a chunk at a time
+            top_driver = np.concatenate([
+                amr_core.top_contributions(sample_contributions(X, slice(start, start + EXPORT_CHUNKSIZE)), 1)[:, 0]
+                for start in range(0, X.shape[0], EXPORT_CHUNKSIZE)
+            ] or [np.array([], dtype=np.intp)])
+            abundances = X.tocsr() if hasattr(X, "tocsr") else X.astype(amr_core.COMPACT_DTYPE, copy=False)
+        with recorder.stage("summary_table"):
+            summary_df = pd.DataFrame({
+                "Sample_ID": sample_index,
+                "AMR_Risk_Score": scores.round(3),
+                "Risk_Category": categories,
+                "Dominant_Mechanism": np.array(MECHANISMS)[profiles.argmax(axis=1)],
+                "Dominant_Proportion": profiles.max(axis=1),
+                "Top_Driver_Gene": np.array(TOP_GENES)[top_driver],
+            }).join(ood)
+        uncertainty = None
+        if ensemble is not None:
+            with recorder.stage("ensemble_intervals", models=ensemble.n_models):
+                # All bootstrap models at once: (samples x genes) @ (genes x models)
+                uncertainty = amr_core.uncertainty_frame(*amr_core.score_intervals(X, ensemble))
+            summary_df = summary_df.join(uncertainty)
+        result = UploadResult(missing, sample_index, scores, profiles, abundances, summary_df, unobserved_genes,
+                              uncertainty, categories, cohort, quality, score_bound, ood)
+
+    cache.put(key, result, result.nbytes)
+    return result
 
 # --------------------------------------------------
 # File upload section
@@ -240,13 +597,18 @@ st.markdown("""
 <div class="info-box">
     <strong>File Format:</strong> CSV with samples as rows and AMR genes as columns<br>
     <strong>Required Genes:</strong> Must include all 50 key AMR genes used in the model<br>
+    <strong>Compression:</strong> CSVs may be uploaded gzip, bz2 or zstd compressed (<code>.csv.gz</code>, <code>.csv.bz2</code>, <code>.csv.zst</code>)<br>
+    <strong>Columnar:</strong> Parquet and Arrow IPC (<code>.parquet</code>, <code>.arrow</code>/<code>.feather</code>) tables are read with only the model gene columns loaded<br>
+    <strong>Long Format:</strong> A three-column CSV of (Sample_ID, gene, abundance) rows is also accepted<br>
+    <strong>Sparse Data:</strong> Mostly-zero tables can be uploaded as a scipy CSR <code>.npz</code> with <code>genes</code> (and optional <code>samples</code>) arrays<br>
 </div>
 """, unsafe_allow_html=True)
 
 uploaded_file = st.file_uploader(
     "**Drag and drop your CSV file here**",
-    type=["csv"],
-    help="Upload gene abundance CSV (rows = samples, columns = AMR genes)"
+    type=["csv", "gz", "bz2", "zst", "parquet", "arrow", "feather", "npz"],
+    help="Upload gene abundance CSV (rows = samples, columns = AMR genes), optionally .gz/.bz2/.zst compressed, "
+         "a Parquet/Arrow IPC table, or a sparse .npz matrix"
 )
 
 # Show sample data structure
@@ -266,11 +628,14 @@ with st.expander("📁 Expected Data Structure", expanded=True):
 # Process uploaded file
 # --------------------------------------------------
 if uploaded_file:
+    recorder = StageRecorder(enabled=show_diagnostics)
+    # Exports are timed when downloaded, after this run has finished (see deferred_export)
+    export_stages = st.session_state.setdefault("export_stages", deque(maxlen=20))
+    result = None
     try:
-        df = pd.read_csv(uploaded_file, index_col=0)
-        
-        # Check for required genes
-        missing = set(TOP_GENES) - set(df.columns)
+        result = analyze_upload(uploaded_file, recorder, ensemble if show_uncertainty else None,
+                                st.session_state.get("on_invalid", "report"), compact_mode)
+        missing = result.missing
         if missing:
             st.error(f"❌ Missing {len(missing)} required genes")
             st.info(f"First 5 missing genes: {list(missing)[:5]}")
@@ -279,7 +644,7 @@ if uploaded_file:
             col1, col2 = st.columns(2)
             with col1:
                 st.write("**Required Genes (50 total):**")
-                st.write(f"Found: {len(set(TOP_GENES) & set(df.columns))}")
+                st.write(f"Found: {len(TOP_GENES) - len(missing)}")
                 st.write(f"Missing: {len(missing)}")
             
             with col2:
@@ -290,168 +655,144 @@ if uploaded_file:
                     mime="text/plain"
                 )
             st.stop()
+
+        if not result.quality.ok:
+            render_quality_report(result.quality, None if result.scores is None else len(result.sample_ids))
+            if result.scores is None:
+                if not len(result.sample_ids):
+                    st.error("❌ No valid samples remain after removing the invalid ones. "
+                             "Choose another way to handle them above or correct the file.")
+                st.stop()
         
-        # Prepare data
-        df = df[TOP_GENES]
-        X_scaled = scaler.transform(df)
-        scores = model.predict(X_scaled)
+        if not len(result.sample_ids):
+            st.error("❌ The file contains no samples. Add at least one sample and upload it again.")
+            st.stop()
+
+        sample_ids = result.sample_ids
+        scores = result.scores
+        profiles = result.profiles
+        categories = result.categories
+        cohort = result.cohort
         
         # Summary statistics
-        st.success(f"✅ Successfully analyzed {len(df)} samples")
+        st.success(f"✅ Successfully analyzed {len(sample_ids)} samples")
+        if result.score_bound is not None:
+            st.caption(f"Compact float32 mode: every score is within ±{result.score_bound:,.3g} of its float64 value; "
+                       "samples near a risk threshold were rescored in float64.")
+        if result.unobserved_genes:
+            st.info(f"{len(result.unobserved_genes)} model genes never occur in this long-format table "
+                    f"and were treated as zero abundance, e.g. {list(result.unobserved_genes)[:5]}")
         
         # Display summary metrics
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Samples Analyzed", len(df))
+            st.metric("Samples Analyzed", len(sample_ids))
         with col2:
-            avg_score = np.mean(scores)
-            st.metric("Average AMR Score", f"{avg_score:,.0f}")
+            st.metric("Average AMR Score", f"{cohort['mean_score']:,.0f}")
         with col3:
-            high_risk = sum(1 for s in scores if risk_category(s) == "High")
-            st.metric("High Risk Samples", high_risk)
+            st.metric("High Risk Samples", cohort["category_counts"]["High"])
+        with col4:
+            st.metric("Out-of-Distribution", cohort["out_of_distribution"],
+                      help="Samples whose RMS z-score over the model genes exceeds "
+                           f"{amr_core.OOD_THRESHOLDS[0]:g}, or any one gene's |z| exceeds "
+                           f"{amr_core.OOD_THRESHOLDS[1]:g}, against the training data")
         
         # --------------------------------------------------
         # Per-sample output with better UI
         # --------------------------------------------------
         st.markdown("## 📊 Results by Sample")
         
-        for i, sample_id in enumerate(df.index):
-            sample_score = float(scores[i])
-            risk_cat = risk_category(sample_score)
-            risk_color = get_risk_color(risk_cat)
-            
-            # Calculate mechanism profile
-            mech_profile = compute_sample_mechanisms(df.loc[sample_id])
-            
-            # Create a clean results display
-            with st.container():
-                st.markdown(f"### 🧪 Sample: `{sample_id}`")
-                
-                # Metrics in columns
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.markdown(f"**AMR Burden Score**")
-                    st.markdown(f"<h2 style='margin-top:0;'>{sample_score:,.2f}</h2>", unsafe_allow_html=True)
-                
-                with col2:
-                    st.markdown(f"**Risk Category**")
-                    st.markdown(f"<h3 class='{risk_color}'>{risk_cat}</h3>", unsafe_allow_html=True)
-                
-                with col3:
-                    st.markdown(f"**Interpretation**")
-                    st.info(interpret(mech_profile))
-                
-                # Resistance Mechanism Profile
-                st.markdown("##### Resistance Mechanism Profile")
-                
-                # Create a better visualization
-                col1, col2 = st.columns([2, 3])
-                
-                with col1:
-                    # Mechanism table
-                    mech_df = pd.DataFrame({
-                        'Mechanism': list(mech_profile.keys()),
-                        'Proportion': list(mech_profile.values())
-                    }).sort_values('Proportion', ascending=False)
-                    
-                    # Format for display
-                    mech_df['Proportion'] = mech_df['Proportion'].apply(lambda x: f"{x:.1%}")
-                    st.dataframe(
-                        mech_df,
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                
-                with col2:
-                    # Visualization
-                    fig, ax = plt.subplots(figsize=(8, 4))
-                    
-                    # Sort for better visualization
-                    sorted_mechs = dict(sorted(mech_profile.items(), key=lambda x: x[1], reverse=True))
-                    
-                    colors = plt.cm.Set3(np.linspace(0, 1, len(sorted_mechs)))
-                    bars = ax.barh(list(sorted_mechs.keys()), list(sorted_mechs.values()), color=colors)
-                    
-                    ax.set_xlabel('Proportion', fontsize=10)
-                    ax.set_title('Resistance Mechanism Distribution', fontsize=12, pad=20)
-                    ax.set_xlim(0, 1)
-                    
-                    # Add value labels
-                    for bar in bars:
-                        width = bar.get_width()
-                        if width > 0.05:  # Only label if significant
-                            ax.text(width + 0.01, bar.get_y() + bar.get_height()/2, 
-                                   f'{width:.1%}', 
-                                   va='center', fontsize=9)
-                    
-                    plt.tight_layout()
-                    st.pyplot(fig)
-                
-                # Raw JSON in expander (for users who need it)
-                with st.expander("📋 View Raw JSON Output"):
-                    output = {
-                        "Sample_ID": sample_id,
-                        "AMR_Risk_Score": round(sample_score, 3),
-                        "Risk_Category": risk_cat,
-                        "Resistance_Mechanism_Profile": mech_profile,
-                        "Interpretation": interpret(mech_profile)
-                    }
-                    st.code(json.dumps(output, indent=2), language="json")
-                
-                # Download button for this sample's results
-                json_str = json.dumps(output, indent=2)
-                st.download_button(
-                    label=f"📥 Download Results for {sample_id}",
-                    data=json_str,
-                    file_name=f"amr_results_{sample_id}.json",
-                    mime="application/json",
-                    key=f"download_{sample_id}"
-                )
-                
-                st.divider()
+        # Compact summary of the whole cohort; full detail is rendered only for
+        # the visible page so render time stays flat as the cohort grows
+        st.dataframe(result.summary_df, width="stretch", hide_index=True, height=300)
         
-        # Batch download option
-        st.markdown("### 📦 Batch Export")
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            page_size = st.selectbox("Samples per page", [5, 10, 25, 50], index=1, key="results_page_size")
+        n_pages = max(1, -(-len(sample_ids) // page_size))
+        with col2:
+            page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1, key="results_page")
+        with col3:
+            jump_to = st.text_input("Go to Sample_ID", placeholder="Leave empty to browse pages", key="results_sample")
         
-        # Create comprehensive results
-        all_results = []
-        for i, sample_id in enumerate(df.index):
-            mech_profile = compute_sample_mechanisms(df.loc[sample_id])
-            all_results.append({
-                "Sample_ID": sample_id,
-                "AMR_Risk_Score": round(float(scores[i]), 3),
-                "Risk_Category": risk_category(scores[i]),
-                "Resistance_Mechanism_Profile": mech_profile,
-                "Interpretation": interpret(mech_profile)
-            })
+        if jump_to.strip():
+            page_rows = np.flatnonzero(sample_ids.astype(str) == jump_to.strip())
+            if len(page_rows) == 0:
+                st.warning(f"No sample with ID `{jump_to.strip()}`")
+        else:
+            start = (page - 1) * page_size
+            page_rows = np.arange(start, min(start + page_size, len(sample_ids)))
+            st.caption(f"Showing samples {start + 1}–{start + len(page_rows)} of {len(sample_ids)} (page {page} of {n_pages})")
         
-        # Convert to DataFrame for CSV export
-        results_df = pd.DataFrame(all_results)
+        with recorder.stage("render_samples", samples=len(page_rows)):
+            page_contributions = sample_contributions(result.abundances, page_rows)
+            for i, sample_id, contribution_row in zip(page_rows, sample_ids[page_rows].tolist(), page_contributions):
+                render_sample(i, sample_id, float(scores[i]), categories[i], profiles[i], contribution_row, cohort,
+                              result.ood.iloc[i:i + 1].to_dict("records")[0],
+                              result.uncertainty.iloc[i] if result.uncertainty is not None else None)
         
-        col1, col2 = st.columns(2)
-        with col1:
-            # Download as CSV
-            csv = results_df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download All Results (CSV)",
-                data=csv,
-                file_name="amr_results_all.csv",
-                mime="text/csv"
-            )
+        # Batch download option
+        st.markdown("### 📦 Batch Export")
         
-        with col2:
-            # Download as JSON
-            json_all = json.dumps(all_results, indent=2)
-            st.download_button(
-                label="📥 Download All Results (JSON)",
-                data=json_all,
-                file_name="amr_results_all.json",
-                mime="application/json"
-            )
+        # Exports are only serialized, chunk by chunk, when their button is clicked
+        def write_columnar(fmt):
+            def write(out):
+                empty = amr_core.results_frame(sample_ids[:0], scores[:0], profiles[:0], assets, result.ood[:0])
+                with amr_io.ColumnarWriter(out, empty, fmt) as writer:
+                    for start in range(0, len(sample_ids), EXPORT_CHUNKSIZE):
+                        rows = slice(start, start + EXPORT_CHUNKSIZE)
+                        writer.write(amr_core.results_frame(sample_ids[rows], scores[rows], profiles[rows], assets,
+                                                            result.ood[rows]))
+            return write
+
+        def write_contributions(out):
+            for start in range(0, len(sample_ids), EXPORT_CHUNKSIZE):
+                rows = slice(start, start + EXPORT_CHUNKSIZE)
+                chunk = amr_core.contributions_frame(sample_ids[rows], scores[rows],
+                                                     sample_contributions(result.abundances, rows), assets)
+                out.write(chunk.to_csv(header=start == 0).encode("utf-8"))
+
+        exports = [
+            ("CSV", "amr_results_all.csv", "text/csv", write_text_chunks(
+                lambda: amr_core.iter_results_csv(sample_ids, scores, profiles, MECHANISMS, EXPORT_CHUNKSIZE, categories,
+                                          result.ood))),
+            ("NDJSON", "amr_results_all.ndjson", "application/x-ndjson", write_text_chunks(
+                lambda: amr_core.iter_results_ndjson(sample_ids, scores, profiles, MECHANISMS, EXPORT_CHUNKSIZE, categories,
+                                             result.ood))),
+            # Columnar exports, one row per sample with a column per mechanism
+            ("Parquet", "amr_results_all.parquet", "application/vnd.apache.parquet", write_columnar("parquet")),
+            ("Arrow", "amr_results_all.arrow", "application/vnd.apache.arrow.file", write_columnar("arrow")),
+            # Exact per-gene contributions for every sample, one column per model gene
+            ("Gene contributions CSV", "amr_gene_contributions.csv", "text/csv", write_contributions),
+            ("Per-sample JSON zip", "amr_results_all.zip", "application/zip",
+             write_json_bundle(sample_ids, scores, categories, profiles, result.ood)),
+            ("Cohort summary JSON", "amr_cohort_summary.json", "application/json",
+             write_text_chunks(lambda: [json.dumps(cohort, indent=2)])),
+        ]
+        for col, (label, file_name, mime, write) in zip(st.columns(len(exports)), exports):
+            with col:
+                st.download_button(
+                    label=f"📥 Download All Results ({label})",
+                    data=deferred_export(write, file_name, show_diagnostics, export_stages),
+                    file_name=file_name,
+                    mime=mime
+                )
     
     except Exception as e:
         st.error(f"❌ Error processing file: {str(e)}")
         st.info("Please check your file format and try again.")
+    
+    finally:
+        recorder.finish(file_name=uploaded_file.name, file_bytes=uploaded_file.size,
+                        samples=len(result.sample_ids) if result is not None and result.sample_ids is not None else 0)
+        if show_diagnostics:
+            with st.expander("🩺 Diagnostics", expanded=False):
+                st.dataframe(pd.DataFrame(recorder.stages), width="stretch", hide_index=True)
+                if export_stages:
+                    st.markdown("**Recent exports** (timed when downloaded)")
+                    st.dataframe(pd.DataFrame(list(export_stages)), width="stretch", hide_index=True)
+                st.caption("Memory is traced for the whole server process: peak_mb also counts "
+                           "allocations made by other sessions running at the same time.")
 
 # --------------------------------------------------
 # Footer
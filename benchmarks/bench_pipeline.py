@@ -0,0 +1,200 @@
+"""Per-stage timings of the scoring pipeline on synthetic cohorts.
+
+Times every stage of the upload path separately: loading the model assets
+(compact artifact and, if scikit-learn is installed, the original pickles),
+CSV parsing (full and column-pruned), df[TOP_GENES] selection,
+scaler.transform and model.predict, the fused scoring kernel (float64 and
+compact float32, with the latter's largest deviation), the out-of-distribution
+check, mechanism profiles, interpret, chart rendering and the chunked CSV/NDJSON batch exports.
+
+Cohorts are 100, 10k and 1M samples over the 50 model genes plus a wide
+table of 5k genes. Results are written as JSON tagged with the git commit so
+runs can be compared across commits:
+
+    python benchmarks/bench_pipeline.py --output bench_before.json
+    python benchmarks/bench_pipeline.py --output bench_after.json --compare bench_before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import amr_charts
+import amr_core
+import amr_io
+from synthetic import write_cohort
+
+# Charts are only drawn for the visible page, so they are timed per sample
+CHART_SAMPLES = 50
+
+
+def timed(fn, repeat):
+    """Best wall time of fn over repeat runs, and its last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_sklearn():
+    try:
+        import joblib
+        import sklearn  # noqa: F401
+    except ImportError:
+        return None
+    from amr_artifact import MODEL_PKL_PATH, SCALER_PKL_PATH
+    return lambda: (joblib.load(MODEL_PKL_PATH), joblib.load(SCALER_PKL_PATH))
+
+
+def bench_cohort(path, assets, n_samples, n_genes, repeat, sklearn_loader):
+    top_genes = assets.top_genes
+    stages = {}
+
+    stages["read_csv"], df = timed(lambda: pd.read_csv(path, index_col=0), repeat)
+    stages["select_top_genes"], df = timed(lambda: df[top_genes], repeat)
+
+    def read_pruned():
+        usecols, _ = amr_io.plan_columns(amr_io.read_header(path), top_genes)
+        return amr_io.read_abundances(path, top_genes, usecols)
+    stages["read_csv_pruned"], df = timed(read_pruned, repeat)
+    X = df.to_numpy()
+
+    if sklearn_loader is not None:
+        model, scaler = sklearn_loader()
+        stages["scaler_transform"], X_scaled = timed(lambda: scaler.transform(df), repeat)
+        stages["model_predict"], _ = timed(lambda: model.predict(X_scaled), repeat)
+
+    stages["score_array"], scores = timed(lambda: amr_core.score_array(X, assets.weights, assets.bias), repeat)
+
+    def read_compact():
+        usecols, _ = amr_io.plan_columns(amr_io.read_header(path), top_genes)
+        return amr_io.read_abundances(path, top_genes, usecols, dtype=amr_core.COMPACT_DTYPE).to_numpy()
+    stages["read_csv_compact"], X_compact = timed(read_compact, repeat)
+    stages["score_array_compact"], (compact_scores, bound) = timed(
+        lambda: amr_core.compact_scores(X_compact, assets.weights, assets.bias), repeat)
+    compact_error = {
+        "max_abs_deviation": float(np.abs(compact_scores - scores).max()),
+        "max_error_bound": float(bound.max()),
+    }
+    del X_compact
+    stages["ood_statistics"], _ = timed(lambda: amr_core.ood_statistics(X, assets.mean, assets.scale), repeat)
+    stages["mechanism_profiles"], profiles = timed(
+        lambda: amr_core.mechanism_profiles(X, assets.mech_matrix), repeat)
+    stages["interpret"], _ = timed(
+        lambda: [amr_core.interpret(amr_core.profile_dict(row, assets.mechanisms)) for row in profiles], 1)
+
+    n_charts = min(CHART_SAMPLES, n_samples)
+    chart_seconds, _ = timed(lambda: [
+        json.dumps(amr_charts.mechanism_chart(amr_core.profile_dict(profiles[i], assets.mechanisms)).to_dict())
+        for i in range(n_charts)
+    ], 1)
+    stages["chart_render_per_sample"] = chart_seconds / n_charts
+
+    sample_ids = df.index
+    stages["export_csv"], _ = timed(lambda: sum(
+        len(chunk) for chunk in amr_core.iter_results_csv(sample_ids, scores, profiles, assets.mechanisms)), 1)
+    stages["export_ndjson"], _ = timed(lambda: sum(
+        len(chunk) for chunk in amr_core.iter_results_ndjson(sample_ids, scores, profiles, assets.mechanisms)), 1)
+
+    return {
+        "name": f"{n_samples}x{n_genes}",
+        "samples": n_samples,
+        "genes": n_genes,
+        "file_mb": round(os.path.getsize(path) / 2**20, 2),
+        "compact": compact_error,
+        "stages": {name: round(seconds, 6) for name, seconds in stages.items()},
+    }
+
+
+def compare(current, baseline):
+    """Print per-stage ratios current / baseline for cohorts present in both."""
+    base_cohorts = {c["name"]: c for c in baseline["cohorts"]}
+    print(f"vs. baseline {baseline.get('commit') or '?'} (ratio > 1 is slower)", file=sys.stderr)
+    for cohort in current["cohorts"]:
+        base = base_cohorts.get(cohort["name"])
+        if base is None:
+            continue
+        print(f"  {cohort['name']}", file=sys.stderr)
+        for stage, seconds in cohort["stages"].items():
+            if base["stages"].get(stage):
+                print(f"    {stage:<24} {seconds / base['stages'][stage]:6.2f}x", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 1_000_000],
+                        help="Cohort sizes over the 50 model genes")
+    parser.add_argument("--wide-genes", type=int, default=5000, help="Total genes in the wide table (0 to skip)")
+    parser.add_argument("--wide-samples", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per fast stage; the best is kept")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    sklearn_loader = load_sklearn()
+    stages = {}
+    stages["load_assets"], assets = timed(amr_core.load_assets, args.repeat)
+    if sklearn_loader is not None:
+        stages["load_pickles"], _ = timed(sklearn_loader, args.repeat)
+    else:
+        print("scikit-learn not installed; skipping pickle/transform/predict stages", file=sys.stderr)
+
+    n_genes = len(assets.top_genes)
+    cohorts = [(n, 0) for n in args.sizes]
+    if args.wide_genes > n_genes:
+        cohorts.append((args.wide_samples, args.wide_genes - n_genes))
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "startup": {name: round(seconds, 6) for name, seconds in stages.items()},
+        "cohorts": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_samples, n_extra in cohorts:
+            path = os.path.join(tmp, f"cohort_{n_samples}_{n_extra}.csv")
+            write_cohort(path, assets.top_genes, n_samples, n_extra_genes=n_extra)
+            cohort = bench_cohort(path, assets, n_samples, n_genes + n_extra, args.repeat, sklearn_loader)
+            results["cohorts"].append(cohort)
+            print(f"{cohort['name']}: " + ", ".join(f"{k}={v:.4g}s" for k, v in cohort["stages"].items()),
+                  file=sys.stderr)
+            os.remove(path)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Per-sample cost of the mechanism chart: matplotlib PNG vs. Vega-Lite spec.
+
+"before" reproduces the old server-side chart (plt.subplots + barh, saved as
+a PNG the way st.pyplot does, figure never closed). "after" builds the
+Altair chart and serializes it to the JSON Streamlit ships to the browser.
+matplotlib is only needed for the "before" numbers.
+
+    python benchmarks/bench_render.py --samples 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amr_charts
+import amr_core
+
+
+def random_profiles(assets, n_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.exponential(1000.0, size=(n_samples, len(assets.top_genes)))
+    profiles = amr_core.mechanism_profiles(X, assets.mech_matrix)
+    return [amr_core.profile_dict(row, assets.mechanisms) for row in profiles]
+
+
+def render_matplotlib(mech_profile, plt):
+    fig, ax = plt.subplots(figsize=(8, 4))
+    sorted_mechs = dict(sorted(mech_profile.items(), key=lambda x: x[1], reverse=True))
+    colors = plt.cm.Set3(np.linspace(0, 1, len(sorted_mechs)))
+    bars = ax.barh(list(sorted_mechs.keys()), list(sorted_mechs.values()), color=colors)
+    ax.set_xlabel('Proportion', fontsize=10)
+    ax.set_title('Resistance Mechanism Distribution', fontsize=12, pad=20)
+    ax.set_xlim(0, 1)
+    for bar in bars:
+        width = bar.get_width()
+        if width > 0.05:
+            ax.text(width + 0.01, bar.get_y() + bar.get_height()/2, f'{width:.1%}', va='center', fontsize=9)
+    plt.tight_layout()
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=200, bbox_inches="tight")
+    return buf.getbuffer().nbytes
+
+
+def render_vega(mech_profile):
+    return len(json.dumps(amr_charts.mechanism_chart(mech_profile).to_dict()))
+
+
+def measure(render, profiles):
+    """Wall time per sample, then memory still held after rendering them all.
+
+    Memory is traced in a second pass so tracemalloc overhead doesn't skew
+    the timings.
+    """
+    start = time.perf_counter()
+    payload = sum(render(p) for p in profiles)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for p in profiles:
+        render(p)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(profiles)
+    return {
+        "ms_per_sample": round(1000 * elapsed / n, 3),
+        "payload_bytes_per_sample": round(payload / n),
+        "retained_mb": round(retained / 2**20, 2),
+        "peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    assets = amr_core.load_assets()
+    profiles = random_profiles(assets, args.samples)
+    render_vega(profiles[0])  # warm up Altair's schema validation
+
+    results = {"samples": args.samples}
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib not installed; skipping the 'before' measurement", file=sys.stderr)
+    else:
+        results["before_matplotlib_png"] = measure(lambda p: render_matplotlib(p, plt), profiles)
+        results["before_matplotlib_png"]["open_figures"] = len(plt.get_fignums())
+        plt.close("all")
+    results["after_vega_lite_spec"] = measure(render_vega, profiles)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
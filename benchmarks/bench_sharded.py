@@ -0,0 +1,64 @@
+"""Scaling of sharded batch scoring with the number of worker processes.
+
+Writes a synthetic cohort CSV, scores it with amr_batch.score_csv (serial)
+and amr_batch.score_csv_sharded for each worker count, checks the outputs
+are identical, and reports wall time, throughput, speedup and parallel
+efficiency.
+
+    python benchmarks/bench_sharded.py --samples 1000000 --workers 1 2 4 8 16 32 64
+"""
+import argparse
+import filecmp
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amr_batch
+import amr_core
+from synthetic import write_cohort
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--chunksize", type=int, default=amr_batch.DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    assets = amr_core.load_assets()
+    results = {"samples": args.samples, "cpu_count": os.cpu_count(), "runs": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "cohort.csv")
+        write_cohort(input_path, assets.top_genes, args.samples)
+        results["input_mb"] = round(os.path.getsize(input_path) / 2**20, 1)
+
+        serial_path = os.path.join(tmp, "serial.csv")
+        start = time.perf_counter()
+        amr_batch.score_csv(input_path, serial_path, assets, args.chunksize)
+        serial = time.perf_counter() - start
+        results["serial_s"] = round(serial, 3)
+
+        for workers in sorted(set(args.workers)):
+            output_path = os.path.join(tmp, f"sharded-{workers}.csv")
+            start = time.perf_counter()
+            amr_batch.score_csv_sharded(input_path, output_path, assets, workers, args.chunksize)
+            elapsed = time.perf_counter() - start
+            results["runs"].append({
+                "workers": workers,
+                "seconds": round(elapsed, 3),
+                "samples_per_s": round(args.samples / elapsed),
+                "speedup": round(serial / elapsed, 2),
+                "efficiency": round(serial / elapsed / workers, 2),
+                "identical_to_serial": filecmp.cmp(serial_path, output_path, shallow=False),
+            })
+            os.remove(output_path)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Load test for amr_server.py: p50/p99 latency and throughput.
+
+Fires single-sample JSON requests from many concurrent clients (one
+keep-alive connection each) and reports the latency distribution and the
+overall request rate. By default an in-process server is started on a free
+port; pass --url to hit one that is already running.
+
+    python benchmarks/load_test.py --clients 32 --requests 200
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --clients 64
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amr_core
+import amr_server
+
+
+def client(url, bodies, latencies, errors):
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    for body in bodies:
+        start = time.perf_counter()
+        conn.request("POST", "/score", body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(response.status)
+    conn.close()
+
+
+def run(url, top_genes, n_clients, n_requests, seed=0):
+    rng = np.random.default_rng(seed)
+    bodies = [
+        [
+            json.dumps({"Sample_ID": f"c{c}_r{r}", **dict(zip(top_genes, rng.exponential(1000.0, len(top_genes))))})
+            for r in range(n_requests)
+        ]
+        for c in range(n_clients)
+    ]
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(url, b, latencies, errors)) for b in bodies]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "clients": n_clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Server to test (default: start one in-process)")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client")
+    parser.add_argument("--max-wait-ms", type=float, default=amr_server.DEFAULT_MAX_WAIT_MS,
+                        help="Batch window of the in-process server")
+    args = parser.parse_args(argv)
+
+    assets = amr_core.load_assets()
+    server = None
+    if args.url:
+        url = urlparse(args.url)
+    else:
+        server = amr_server.make_server(assets, port=0, max_wait_ms=args.max_wait_ms)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = urlparse(f"http://127.0.0.1:{server.server_address[1]}")
+
+    results = run(url, assets.top_genes, args.clients, args.requests)
+    if server is not None:
+        results["max_wait_ms"] = args.max_wait_ms
+        results["batches"] = server.batcher.batches
+        results["mean_batch_rows"] = round(results["requests"] / max(server.batcher.batches, 1), 1)
+        server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""Synthetic abundance tables shared by the benchmark scripts."""
+import numpy as np
+import pandas as pd
+
+
+def write_cohort(path, top_genes, n_samples, n_extra_genes=0, chunk=100_000, seed=0):
+    """Write a (samples x genes) abundance CSV in chunks.
+
+    With n_extra_genes the model genes are shuffled in among that many filler
+    gene columns, like a full MEGARes/ResFinder table.
+    """
+    rng = np.random.default_rng(seed)
+    columns = list(top_genes) + [f"FILLER_GENE_{i}" for i in range(n_extra_genes)]
+    order = rng.permutation(len(columns)) if n_extra_genes else np.arange(len(columns))
+    columns = [columns[i] for i in order]
+    for start in range(0, n_samples, chunk):
+        n = min(chunk, n_samples - start)
+        df = pd.DataFrame(rng.exponential(1000.0, size=(n, len(columns))), columns=columns,
+                          index=pd.Index([f"S{i}" for i in range(start, start + n)], name="Sample_ID"))
+        df.to_csv(path, mode="w" if start == 0 else "a", header=(start == 0), float_format="%.4f")